@@ -6,14 +6,32 @@
 
 """ Module for MQTT Sparkplug B Python async plugin """
 import asyncio
+import base64
 import copy
+import gc
+import hashlib
+import json
 import logging
-from datetime import datetime, timezone
-import ctypes
+import mmap
+import multiprocessing
+import os
+import random
+import string
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from itertools import chain
+from operator import attrgetter, itemgetter
 import async_ingest
 import paho.mqtt.client as mqtt
+from google.protobuf.internal import api_implementation
 from fledge.common import logger
-from fledge.plugins.common import utils
+from fledge.common.common import _FLEDGE_DATA, _FLEDGE_ROOT
 try:
     from fledge.plugins.south.mqtt_sparkplug.sparkplug_b import sparkplug_b_pb2
 except:
@@ -109,7 +127,7 @@ _DEFAULT_CONFIG = {
     'datapoints': {
         'description': 'To construct reading datapoints from the received data attributes on topic',
         'type': 'enumeration',
-        'options': ['Per metric', 'Per device'],
+        'options': ['Per metric', 'Per device', 'Per timestamp'],
         'default': 'Per metric',
         'order': '9',
         'displayName': 'Datapoints',
@@ -123,14 +141,290 @@ _DEFAULT_CONFIG = {
         'displayName': 'Attach Topic as a Datapoint',
         'group': 'Readings Structure'
     },
+    'reportByException': {
+        'description': 'Drop readings of a metric whose value has not changed, or is within the deadband of the last '
+                       'value passed on',
+        'type': 'enumeration',
+        'options': ['Disabled', 'Unchanged', 'Absolute deadband', 'Percent deadband'],
+        'default': 'Disabled',
+        'order': '18',
+        'displayName': 'Report By Exception',
+        'group': 'Readings Structure'
+    },
+    'deadband': {
+        'description': 'Change from the last value passed on that a numeric metric value must exceed to be passed on, '
+                       'as an absolute value or a percentage of the last value',
+        'type': 'float',
+        'default': '0',
+        'minimum': '0',
+        'order': '19',
+        'displayName': 'Deadband',
+        'group': 'Readings Structure',
+        'validity': 'reportByException == "Absolute deadband" || reportByException == "Percent deadband"'
+    },
+    'heartbeatInterval': {
+        'description': 'Maximum time in seconds between two values passed on for a metric, even when unchanged. '
+                       'Zero never forces a value',
+        'type': 'integer',
+        'default': '300',
+        'minimum': '0',
+        'order': '20',
+        'displayName': 'Heartbeat Interval',
+        'group': 'Readings Structure',
+        'validity': 'reportByException != "Disabled"'
+    },
+    'dataSets': {
+        'description': 'How the DataSet metrics are turned into readings. Columns gives a datapoint per column '
+                       'holding the column values, Rows gives a reading per row',
+        'type': 'enumeration',
+        'options': ['Columns', 'Rows'],
+        'default': 'Columns',
+        'order': '21',
+        'displayName': 'DataSets',
+        'group': 'Readings Structure'
+    },
+    'sessionAsset': {
+        'description': 'Asset name of the readings recording edge nodes and devices going online and offline, '
+                       'none are created if empty',
+        'type': 'string',
+        'default': '',
+        'order': '24',
+        'displayName': 'Session State Asset',
+        'group': 'Readings Structure'
+    },
     'topic': {
         'description': 'Topic to subscribe',
         'type': 'string',
-        'default': 'spBv1.0/group_id/message_type/edge_node_id/device_id',
+        'default': 'spBv1.0/group_id/DDATA/edge_node_id/device_id',
         'order': '3',
         'displayName': 'Topic',
         'mandatory': 'true',
         'group': 'Topic'
+    },
+    'subscriptions': {
+        'description': 'Additional topics to subscribe. Each entry may override the assetNaming, assetName, '
+                       'topicFragments and datapoints settings for the messages received on its topic',
+        'type': 'JSON',
+        'default': json.dumps({"subscriptions": []}),
+        'order': '16',
+        'displayName': 'Additional Topics',
+        'group': 'Topic'
+    },
+    'sharedSubscriptionGroup': {
+        'description': 'Subscribe to the data messages through MQTT shared subscriptions of this group, so that the '
+                       'services of the group split them between them; BIRTH and DEATH certificates still reach every '
+                       'service. Leave empty to receive all the messages',
+        'type': 'string',
+        'default': '',
+        'order': '17',
+        'displayName': 'Shared Subscription Group',
+        'group': 'Topic'
+    },
+    'batchSize': {
+        'description': 'Maximum number of readings collected before they are passed to ingest as one batch',
+        'type': 'integer',
+        'default': '100',
+        'minimum': '1',
+        'order': '11',
+        'displayName': 'Ingest Batch Size',
+        'group': 'Advanced'
+    },
+    'batchTimeout': {
+        'description': 'Maximum time in milliseconds a reading is held in the batch before it is passed to ingest',
+        'type': 'integer',
+        'default': '100',
+        'minimum': '1',
+        'order': '12',
+        'displayName': 'Ingest Batch Timeout',
+        'group': 'Advanced'
+    },
+    'decodeWorkers': {
+        'description': 'Number of worker threads decoding received messages. Messages of an edge node are always '
+                       'decoded by the same worker',
+        'type': 'integer',
+        'default': '1',
+        'minimum': '1',
+        'maximum': '64',
+        'order': '13',
+        'displayName': 'Decode Workers',
+        'group': 'Advanced'
+    },
+    'queueSize': {
+        'description': 'Maximum number of received messages waiting to be decoded, per worker',
+        'type': 'integer',
+        'default': '10000',
+        'minimum': '1',
+        'order': '14',
+        'displayName': 'Work Queue Size',
+        'group': 'Advanced'
+    },
+    'queueOverflow': {
+        'description': 'Action taken when a message is received and the work queue is full',
+        'type': 'enumeration',
+        'options': ['Block', 'Drop oldest', 'Drop newest'],
+        'default': 'Block',
+        'order': '15',
+        'displayName': 'Work Queue Overflow',
+        'group': 'Advanced'
+    },
+    'multipartTimeout': {
+        'description': 'Time in seconds after which an incomplete multi-part Bytes or File metric is discarded, '
+                       'counted from its last part',
+        'type': 'integer',
+        'default': '60',
+        'minimum': '1',
+        'order': '22',
+        'displayName': 'Multi-part Timeout',
+        'group': 'Advanced'
+    },
+    'multipartMemory': {
+        'description': 'Maximum memory in MB held by incomplete multi-part Bytes or File metrics; the oldest are '
+                       'discarded beyond it',
+        'type': 'integer',
+        'default': '64',
+        'minimum': '1',
+        'order': '23',
+        'displayName': 'Multi-part Memory Limit',
+        'group': 'Advanced'
+    },
+    'rebirthRequests': {
+        'description': 'Publish a Node Control/Rebirth command to an edge node when messages from it were missed or '
+                       'refer to metric aliases that are not known',
+        'type': 'boolean',
+        'default': 'false',
+        'order': '25',
+        'displayName': 'Request Rebirth',
+        'group': 'Advanced'
+    },
+    'rebirthInterval': {
+        'description': 'Minimum time in seconds between two rebirth requests to the same edge node',
+        'type': 'integer',
+        'default': '60',
+        'minimum': '1',
+        'order': '26',
+        'displayName': 'Rebirth Request Interval',
+        'group': 'Advanced',
+        'validity': 'rebirthRequests == "true"'
+    },
+    'reorderWindow': {
+        'description': 'Maximum time in milliseconds a message is held so that the missing messages before it, by the '
+                       'seq of the edge node, can be decoded first; 0 decodes messages in the order they are received',
+        'type': 'integer',
+        'default': '0',
+        'minimum': '0',
+        'order': '27',
+        'displayName': 'Reorder Window',
+        'group': 'Advanced'
+    },
+    'reorderDepth': {
+        'description': 'Maximum number of messages held per edge node while waiting for missing ones',
+        'type': 'integer',
+        'default': '32',
+        'minimum': '1',
+        'maximum': '127',
+        'order': '28',
+        'displayName': 'Reorder Depth',
+        'group': 'Advanced',
+        'validity': 'reorderWindow != "0"'
+    },
+    'birthSnapshot': {
+        'description': 'Keep the metric aliases, datatypes and template definitions of the BIRTH certificates '
+                       'received in a file, so that they are known again when the plugin restarts',
+        'type': 'boolean',
+        'default': 'true',
+        'order': '29',
+        'displayName': 'Keep BIRTH Certificates',
+        'group': 'Advanced'
+    },
+    'reconnectMinDelay': {
+        'description': 'Time in seconds before the first attempt to connect again to the MQTT broker, doubled after '
+                       'each failed attempt',
+        'type': 'integer',
+        'default': '1',
+        'minimum': '1',
+        'order': '30',
+        'displayName': 'Minimum Reconnect Delay',
+        'group': 'Connection'
+    },
+    'reconnectMaxDelay': {
+        'description': 'Maximum time in seconds between two attempts to connect to the MQTT broker',
+        'type': 'integer',
+        'default': '120',
+        'minimum': '1',
+        'order': '31',
+        'displayName': 'Maximum Reconnect Delay',
+        'group': 'Connection'
+    },
+    'reconnectJitter': {
+        'description': 'Percentage of the reconnect delay by which it is randomly shortened, so that clients '
+                       'restarted together do not all connect at once',
+        'type': 'integer',
+        'default': '50',
+        'minimum': '0',
+        'maximum': '100',
+        'order': '32',
+        'displayName': 'Reconnect Jitter',
+        'group': 'Connection'
+    },
+    'statisticsAsset': {
+        'description': 'Asset name of the readings holding the plugin statistics, none are created if empty',
+        'type': 'string',
+        'default': '',
+        'order': '33',
+        'displayName': 'Statistics Asset',
+        'group': 'Advanced'
+    },
+    'statisticsInterval': {
+        'description': 'Time in seconds between two statistics readings',
+        'type': 'integer',
+        'default': '60',
+        'minimum': '1',
+        'order': '34',
+        'displayName': 'Statistics Interval',
+        'group': 'Advanced',
+        'validity': 'statisticsAsset != ""'
+    },
+    'decodeProcesses': {
+        'description': 'Number of processes decoding the received messages, in place of the decode worker threads, '
+                       'so that decoding is spread over several cores; 0 decodes in threads of the plugin',
+        'type': 'integer',
+        'default': '0',
+        'minimum': '0',
+        'maximum': '64',
+        'order': '35',
+        'displayName': 'Decode Processes',
+        'group': 'Advanced'
+    },
+    'sharedMemorySize': {
+        'description': 'Size in KB of the shared memory ring buffer through which received messages are handed to '
+                       'each decode process; 0 sends them through a pipe',
+        'type': 'integer',
+        'default': '1024',
+        'minimum': '0',
+        'order': '36',
+        'displayName': 'Shared Memory Size',
+        'group': 'Advanced',
+        'validity': 'decodeProcesses != "0"'
+    },
+    'pipeline': {
+        'description': 'How received messages are passed through the plugin: by threads, or by coroutines on the '
+                       'event loop of the plugin, which also drives the MQTT connection',
+        'type': 'enumeration',
+        'options': ['Threads', 'Asyncio'],
+        'default': 'Threads',
+        'order': '37',
+        'displayName': 'Pipeline',
+        'group': 'Advanced'
+    },
+    'protobufBackend': {
+        'description': 'Whether messages may be parsed by the pure-Python protobuf implementation, many times slower '
+                       'than the native ones: allowed, allowed with a warning, or the plugin refuses to start',
+        'type': 'enumeration',
+        'options': ['Any', 'Warn If Python', 'Require Native'],
+        'default': 'Any',
+        'order': '38',
+        'displayName': 'Protobuf Backend',
+        'group': 'Advanced'
     }
 }
 
@@ -138,6 +432,27 @@ c_callback = None
 c_ingest_ref = None
 loop = None
 NAMESPACE = "spBv1.0"
+MESSAGE_TYPES = ["NBIRTH", "NDEATH", "DBIRTH", "DDEATH", "NDATA", "DDATA", "NCMD", "DCMD", "STATE"]
+# Configuration items that need the MQTT client to be restarted when changed: connection and subscription
+# settings, and those of the work queues and workers fed by the connection
+_RESTART_ITEMS = frozenset(['url', 'port', 'user', 'password', 'topic', 'subscriptions', 'sharedSubscriptionGroup',
+                            'decodeWorkers', 'queueSize', 'queueOverflow', 'reorderWindow', 'reorderDepth',
+                            'birthSnapshot', 'decodeProcesses', 'sharedMemorySize', 'pipeline', 'protobufBackend'])
+# Maximum number of messages handed to a decode process at once
+_PROCESS_BATCH = 256
+# Maximum seconds a decode process reading a ring buffer sleeps before checking for requests again
+_RING_POLL = 0.1
+# Allocations between two young generation garbage collections in a decode process, the interpreter default is 700
+_PROCESS_GC_THRESHOLD = 10000
+# Seconds between two saves of the BIRTH certificates snapshot while it changes
+_SNAPSHOT_INTERVAL = 60
+# Message types published by edge nodes that carry the seq of the edge node
+_SEQUENCED_TYPES = frozenset(["NBIRTH", "DBIRTH", "NDATA", "DDATA", "DDEATH"])
+# Message types that carry the session state, subscribed without sharing so that each member of a shared
+# subscription group knows the aliases, templates and bdSeq of every edge node
+_SESSION_TYPES = frozenset(["NBIRTH", "NDEATH", "DBIRTH", "DDEATH"])
+# Maximum number of topics whose asset name is cached by each decoder
+_ASSET_CACHE_SIZE = 4096
 
 
 def plugin_info():
@@ -166,11 +481,34 @@ def plugin_init(config):
         data: JSON object to be used in future calls to the plugin
     Raises:
     """
+    check_protobuf_backend(config['protobufBackend']['value'])
     handle = copy.deepcopy(config)
     handle['_mqtt'] = MqttSubscriberClient(handle)
     return handle
 
 
+def check_protobuf_backend(requirement):
+    """ Log the protobuf implementation messages are parsed with
+
+    requirement is the Protobuf Backend setting; RuntimeError is raised for 'Require Native' when it is the
+    pure-Python implementation.
+    """
+    backend = api_implementation.Type()
+    if backend != 'python':
+        _LOGGER.info("Sparkplug B payloads are parsed by the {} protobuf backend.".format(backend))
+        return
+    msg = ("Sparkplug B payloads are parsed by the pure-Python protobuf backend, which is many times slower than "
+           "the native ones. Install a protobuf package built with its C++ extension for this platform and "
+           "Python version, compatible with the generated sparkplug_b_pb2 module.")
+    if requirement == 'Require Native':
+        _LOGGER.error(msg)
+        raise RuntimeError(msg)
+    if requirement == 'Warn If Python':
+        _LOGGER.warning(msg)
+    else:
+        _LOGGER.info("Sparkplug B payloads are parsed by the pure-Python protobuf backend.")
+
+
 def plugin_start(handle):
     """ Extracts data from the sinusoid and returns it in a JSON document as a Python dict.
     Available for async mode only.
@@ -204,6 +542,16 @@ def plugin_reconfigure(handle, new_config):
     """
     _LOGGER.info("Old config for {} {} \n new config {}".format(_PLUGIN_NAME, handle, new_config))
 
+    changed = [key for key, item in new_config.items()
+               if key != '_mqtt' and (key not in handle or handle[key]['value'] != item['value'])]
+    if handle.get('_mqtt') is not None and not any(key in _RESTART_ITEMS for key in changed):
+        # Readings structure changes are applied to the running client, keeping the MQTT session
+        new_handle = copy.deepcopy(new_config)
+        new_handle['_mqtt'] = handle['_mqtt']
+        new_handle['_mqtt'].reconfigure(new_handle)
+        _LOGGER.info("{} reconfigured without reconnecting; changed {}".format(_PLUGIN_NAME, ", ".join(changed)))
+        return new_handle
+
     # plugin_shutdown
     plugin_shutdown(handle)
 
@@ -251,11 +599,902 @@ def plugin_register_ingest(handle, callback, ingest_ref):
     c_ingest_ref = ingest_ref
 
 
+def ingest_readings(readings):
+    """ Pass a list of readings to the South C server in a single ingest call """
+    async_ingest.ingest_callback(c_callback, c_ingest_ref, readings)
+
+
+class ReadingsBatcher(object):
+    """ Collects readings and passes them to ingest as one list once the size or time limit is reached
+
+    The time limit is measured from the first reading of a batch, so no reading waits longer than max_wait seconds
+    and no ingest call carries more than max_size readings.
+    """
+
+    __slots__ = ['_flush_fn', '_max_size', '_max_wait', '_readings', '_deadline', '_condition', '_flush_lock',
+                 '_thread', '_running']
+
+    def __init__(self, flush_fn, max_size, max_wait):
+        self._flush_fn = flush_fn
+        self._max_size = max_size
+        self._max_wait = max_wait
+        self._readings = []
+        self._deadline = None
+        self._condition = threading.Condition()
+        # Serialises flushes so batches reach ingest in the order they were collected
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._running = False
+
+    def add(self, reading):
+        self._condition.acquire()
+        if not self._readings:
+            self._deadline = time.monotonic() + self._max_wait
+            self._condition.notify()
+        self._readings.append(reading)
+        if len(self._readings) < self._max_size:
+            self._condition.release()
+            return
+        self._flush(self._take())
+
+    def flush(self):
+        self._condition.acquire()
+        self._flush(self._take())
+
+    def resize(self, max_size, max_wait):
+        """ Change the limits, the batch being collected keeps its deadline """
+        with self._condition:
+            self._max_size = max_size
+            self._max_wait = max_wait
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="sparkplug-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _take(self):
+        batch = self._readings
+        self._readings = []
+        self._deadline = None
+        return batch
+
+    def _flush(self, batch):
+        """ Hand over a batch; must be called with the condition held, which is released once ordering is kept """
+        self._flush_lock.acquire()
+        self._condition.release()
+        try:
+            if batch:
+                self._flush_fn(batch)
+        except Exception as ex:
+            _LOGGER.error("Failed to ingest {} readings: {}".format(len(batch), str(ex)))
+        finally:
+            self._flush_lock.release()
+
+    def _run(self):
+        while True:
+            self._condition.acquire()
+            while self._running and (self._deadline is None or self._deadline > time.monotonic()):
+                self._condition.wait(None if self._deadline is None else self._deadline - time.monotonic())
+            if not self._running:
+                self._condition.release()
+                return
+            self._flush(self._take())
+
+
+def edge_node_key(topic):
+    """ Key of the edge node publishing on topic i.e. group_id/edge_node_id """
+    components = topic.split('/', 4)
+    return '/'.join(components[1:4:2])
+
+
+def partition_index(topic, count):
+    """ Index of the partition, out of count, the edge node publishing on topic belongs to """
+    return zlib.crc32(edge_node_key(topic).encode()) % count
+
+
+class WorkQueue(object):
+    """ Bounded hand-off queue between the MQTT network thread and a decode worker
+
+    When full, put either blocks until there is space ('Block'), discards the oldest waiting item ('Drop oldest')
+    or discards the item being put ('Drop newest'). Once abandoned, as its consumer has gone, every item is
+    discarded.
+    """
+
+    __slots__ = ['_items', '_capacity', '_policy', '_lock', '_not_empty', '_not_full', '_closed', '_abandoned',
+                 'dropped']
+
+    # Returned by get when it times out
+    EMPTY = object()
+
+    def __init__(self, capacity, policy='Block'):
+        self._items = deque()
+        self._capacity = capacity
+        self._policy = policy
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._closed = False
+        self._abandoned = False
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        """ Returns False if the item, or an older one in its place, has been dropped """
+        with self._lock:
+            accepted = True
+            if self._abandoned:
+                self.dropped += 1
+                return False
+            if len(self._items) >= self._capacity:
+                if self._policy == 'Drop newest':
+                    self._dropped()
+                    return False
+                elif self._policy == 'Drop oldest':
+                    self._items.popleft()
+                    self._dropped()
+                    accepted = False
+                else:
+                    while len(self._items) >= self._capacity and not self._closed and not self._abandoned:
+                        self._not_full.wait()
+                    if self._abandoned:
+                        self.dropped += 1
+                        return False
+            self._items.append(item)
+            self._not_empty.notify()
+            return accepted
+
+    def get(self, timeout=None):
+        """ Returns the next item, waiting for one if needed, or None once the queue is closed and empty
+
+        Returns EMPTY if no item arrives within timeout seconds.
+        """
+        with self._lock:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self._items:
+                if self._closed or self._abandoned:
+                    return None
+                if deadline is None:
+                    self._not_empty.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return WorkQueue.EMPTY
+                    self._not_empty.wait(remaining)
+            item = self._items.popleft()
+            self._not_full.notify()
+            return item
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def abandon(self):
+        """ Drop the waiting items and every item put from now on, get returns None """
+        with self._lock:
+            self._abandoned = True
+            self.dropped += len(self._items)
+            self._items.clear()
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def _dropped(self):
+        if not self.dropped:
+            _LOGGER.warning("Work queue is full, received messages are being dropped.")
+        self.dropped += 1
+
+
+def shared_subscription_filters(topics, group):
+    """ Topic filters subscribing to topics as members of the shared subscription group
+
+    BIRTH and DEATH certificates are subscribed without sharing, and every other message type is shared. A topic
+    filter whose message type is a wildcard is subscribed once per message type.
+    """
+    filters = []
+    for topic in topics:
+        components = topic.split('/')
+        if len(components) < 3 or components[2] == '#':
+            # spBv1.0/# or spBv1.0/group_id/#: any message type of any edge node
+            group_id = components[1] if len(components) == 3 else '+'
+            expanded = ['/'.join([NAMESPACE, group_id, message_type, '#']) for message_type in MESSAGE_TYPES]
+        elif components[2] == '+':
+            expanded = ['/'.join(components[:2] + [message_type] + components[3:]) for message_type in MESSAGE_TYPES]
+        else:
+            expanded = [topic]
+        for topic_filter in expanded:
+            if topic_filter.split('/')[2] not in _SESSION_TYPES:
+                topic_filter = "$share/{}/{}".format(group, topic_filter)
+            if topic_filter not in filters:
+                filters.append(topic_filter)
+    return filters
+
+
+def subscription_settings(config):
+    """ Topics to subscribe with their readings structure settings; the Topic setting comes first
+
+    Entries of the Additional Topics setting take the settings they do not override from the main configuration.
+    """
+    defaults = {
+        'topic': config['topic']['value'],
+        'assetNaming': config['assetNaming']['value'],
+        'assetName': config['assetName']['value'],
+        'topicFragments': config['topicFragments']['value'],
+        'datapoints': config['datapoints']['value']
+    }
+    settings = [defaults]
+    try:
+        value = config['subscriptions']['value']
+        extra = (json.loads(value) if isinstance(value, str) else value).get('subscriptions', [])
+    except (ValueError, AttributeError) as err:
+        _LOGGER.error("Invalid Additional Topics, they are ignored: {}".format(err))
+        return settings
+    topics = {defaults['topic']}
+    for entry in extra:
+        if not isinstance(entry, dict) or not entry.get('topic'):
+            _LOGGER.error("Ignoring Additional Topics entry {}; it must be an object with a topic.".format(entry))
+            continue
+        if not isinstance(entry['topic'], str):
+            _LOGGER.error("Ignoring Additional Topics entry {}; its topic must be a string.".format(entry))
+            continue
+        if entry['topic'] in topics:
+            continue
+        topics.add(entry['topic'])
+        topic = entry['topic']
+        entry_settings = dict(defaults, topic=topic)
+        for key, value in entry.items():
+            if key == 'topic':
+                continue
+            if key not in defaults:
+                _LOGGER.warning("Ignoring unknown setting {} of Additional Topics entry {}.".format(key, topic))
+                continue
+            # Overrides are checked as the configuration item they override would be
+            options = _DEFAULT_CONFIG[key].get('options')
+            if not isinstance(value, str) or (options is not None and value not in options):
+                _LOGGER.error("Ignoring invalid {} {} of Additional Topics entry {}; it must be {}.".format(
+                    key, json.dumps(value), topic, 'one of ' + ', '.join(options) if options else 'a string'))
+                continue
+            entry_settings[key] = value
+        settings.append(entry_settings)
+    return settings
+
+
+class TopicFilterIndex(object):
+    """ Trie of MQTT topic filters, matching a topic to the value of the first added filter it falls under
+
+    Each level of a filter is a node keyed by its level string, including the '+' and '#' wildcards. The value of a
+    filter is held under the None key of its last node together with its priority.
+    """
+
+    __slots__ = ['_root', '_count']
+
+    def __init__(self):
+        self._root = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, topic_filter, value):
+        node = self._root
+        for level in topic_filter.split('/'):
+            node = node.setdefault(level, {})
+        if None not in node:
+            node[None] = (self._count, value)
+            self._count += 1
+
+    def match(self, topic):
+        """ Value of the first added filter matching topic, None if there is none """
+        levels = topic.split('/')
+        depth_of_topic = len(levels)
+        best = None
+        stack = [(self._root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            # '#' also matches the parent level
+            multi_level = node.get('#')
+            if multi_level is not None:
+                entry = multi_level.get(None)
+                if entry is not None and (best is None or entry[0] < best[0]):
+                    best = entry
+            if depth == depth_of_topic:
+                entry = node.get(None)
+                if entry is not None and (best is None or entry[0] < best[0]):
+                    best = entry
+                continue
+            child = node.get(levels[depth])
+            if child is not None:
+                stack.append((child, depth + 1))
+            child = node.get('+')
+            if child is not None:
+                stack.append((child, depth + 1))
+        return None if best is None else best[1]
+
+
+class ReconnectBackoff(object):
+    """ Delays between attempts to connect, doubled from min_delay up to max_delay after each failure
+
+    Each delay is shortened by a random fraction of up to jitter, between 0 and 1, of itself.
+    """
+
+    __slots__ = ['min_delay', 'max_delay', 'jitter', 'failures']
+
+    def __init__(self, min_delay, max_delay, jitter):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.failures = 0
+
+    def next_delay(self):
+        delay = self.min_delay
+        for _ in range(self.failures):
+            delay *= 2
+            if delay >= self.max_delay:
+                break
+        self.failures += 1
+        return min(delay, self.max_delay) * (1 - self.jitter * random.random())
+
+    def reset(self):
+        self.failures = 0
+
+
+class ClientStatistics(object):
+    """ Counters of the MQTT client, passed on as a reading of the statistics asset when it is set """
+
+    __slots__ = ['connection_attempts', 'connection_failures', 'connected', 'started', 'first_message']
+
+    def __init__(self):
+        self.connection_attempts = 0
+        self.connection_failures = 0
+        self.connected = False
+        self.started = None
+        # Seconds from start to the first message received
+        self.first_message = None
+
+    def record_first_message(self):
+        self.first_message = time.monotonic() - self.started
+        _LOGGER.info("First MQTT message received {:.3f} seconds after start.".format(self.first_message))
+
+    def values(self, client):
+        values = {
+            'connectionAttempts': self.connection_attempts,
+            'connectionFailures': self.connection_failures,
+            'connected': int(self.connected),
+            'queued': sum(len(queue) for queue in client.queues),
+            'dropped': sum(queue.dropped for queue in client.queues) + sum(ring.overflows for ring in client.rings),
+            'protobufBackend': api_implementation.Type()
+        }
+        if self.first_message is not None:
+            values['timeToFirstMessage'] = round(self.first_message, 3)
+        return values
+
+
+class SharedRing(object):
+    """ Ring buffer of received messages in anonymous shared memory, from the MQTT network thread to a decode process
+
+    Single producer, single consumer: put is only called by the network thread, and read only by the one decode
+    process forked after the ring is created; each decode process has a ring of its own. A record is a _RECORD
+    header of the payload size, the topic index and the receive time, followed by the payload, padded to 8 bytes.
+    The first message on a topic is preceded by a record defining its index, flagged with _TOPIC, whose payload is
+    the topic.
+
+    When a message does not fit in the free space, put waits for the reader to free some ('Block'), or drops the
+    message and counts it in overflows. The oldest messages belong to the reader, so 'Drop oldest' drops the newest
+    message too. Once the ring is closed, as its reader has exited, put drops every message.
+
+    The head and tail byte counts and the waiting flags are kept in the control area at the start of the memory, and
+    only read or written while holding the process shared lock. Taking and releasing the lock orders the memory
+    accesses of both processes, so a record is complete before its head is seen on any CPU, and a reader or writer
+    only sleeps on its semaphore after the other one has seen its waiting flag.
+    """
+
+    __slots__ = ['capacity', 'overflows', 'closed', '_block', '_memory', '_data', '_lock', '_signal', '_space',
+                 '_tail', '_topics', '_names']
+
+    _RECORD = struct.Struct('<IId')
+    _COUNTER = struct.Struct('<Q')
+    _HEAD = 0
+    _TAIL = 64
+    # Set by the reader waiting for a message, and by the writer waiting for space
+    _WAITING = 128
+    _SPACE_WAITING = 136
+    _CONTROL = 192
+    # Size of the marker skipping the end of the buffer
+    _WRAP = 0xFFFFFFFF
+    _TOPIC = 0x80000000
+
+    def __init__(self, capacity, policy='Block'):
+        context = multiprocessing.get_context('fork')
+        self.capacity = max(capacity & ~7, 64)
+        self.overflows = 0
+        self.closed = False
+        self._block = policy == 'Block'
+        self._memory = mmap.mmap(-1, self._CONTROL + self.capacity)
+        self._data = memoryview(self._memory)[self._CONTROL:]
+        self._lock = context.Lock()
+        self._signal = context.Semaphore(0)
+        self._space = context.Semaphore(0)
+        # Writer: tail last read, the free space is at least what it leaves
+        self._tail = 0
+        # Writer: topic index by topic; reader: topic by index
+        self._topics = {}
+        self._names = []
+
+    def put(self, topic, payload, receive_time):
+        """ Write a message, returns False if it was dropped as it does not fit """
+        index = self._topics.get(topic)
+        if index is None:
+            index = len(self._topics)
+            if not self._write(self._TOPIC | index, 0.0, topic.encode('utf-8')):
+                self._dropped()
+                return False
+            self._topics[topic] = index
+        if not self._write(index, receive_time, payload):
+            self._dropped()
+            return False
+        return True
+
+    def close(self):
+        """ Stop waiting for space, the reader is gone """
+        self.closed = True
+        self._space.release()
+
+    def _dropped(self):
+        if not self.overflows:
+            _LOGGER.warning("Shared memory is full, received messages are being dropped.")
+        self.overflows += 1
+
+    def _write(self, topic, receive_time, payload):
+        counter = self._COUNTER
+        memory = self._memory
+        head = counter.unpack_from(memory, self._HEAD)[0]
+        size = len(payload)
+        needed = (self._RECORD.size + size + 7) & ~7
+        position = head % self.capacity
+        skipped = 0
+        if self.capacity - position < needed:
+            skipped = self.capacity - position
+        while head + skipped + needed - self._tail > self.capacity:
+            with self._lock:
+                self._tail = counter.unpack_from(memory, self._TAIL)[0]
+                if head + skipped + needed - self._tail <= self.capacity:
+                    break
+                # A message that does not fit even in the empty ring is dropped whatever the policy
+                if not self._block or self.closed or self._tail == head:
+                    return False
+                memory[self._SPACE_WAITING] = 1
+            # Bounded, so that a reader that exits without freeing space does not hold the network thread forever
+            self._space.acquire(timeout=_RING_POLL)
+        if skipped:
+            if skipped >= self._RECORD.size:
+                self._RECORD.pack_into(self._data, position, self._WRAP, 0, 0.0)
+            position = 0
+        self._RECORD.pack_into(self._data, position, size, topic, receive_time)
+        start = position + self._RECORD.size
+        self._data[start:start + size] = payload
+        # Publish the record only once it is complete
+        with self._lock:
+            counter.pack_into(memory, self._HEAD, head + skipped + needed)
+            waiting = memory[self._WAITING]
+            memory[self._WAITING] = 0
+        if waiting:
+            self._signal.release()
+        return True
+
+    def read(self, handler):
+        """ Call handler(topic, payload, receive_time) for each message written, payload being a memoryview of the
+        shared memory that is only valid during the call; returns the number of messages read """
+        counter = self._COUNTER
+        record = self._RECORD
+        data = self._data
+        memory = self._memory
+        with self._lock:
+            head = counter.unpack_from(memory, self._HEAD)[0]
+            tail = counter.unpack_from(memory, self._TAIL)[0]
+        count = 0
+        while tail != head:
+            position = tail % self.capacity
+            if self.capacity - position < record.size:
+                tail += self.capacity - position
+                continue
+            size, topic, receive_time = record.unpack_from(data, position)
+            if size == self._WRAP:
+                tail += self.capacity - position
+                continue
+            start = position + record.size
+            payload = data[start:start + size]
+            if topic & self._TOPIC:
+                self._names.append(str(payload, 'utf-8'))
+            else:
+                handler(self._names[topic], payload, receive_time)
+                count += 1
+            tail += (record.size + size + 7) & ~7
+            # Free the space of each record as soon as it has been handled
+            with self._lock:
+                counter.pack_into(memory, self._TAIL, tail)
+                head = counter.unpack_from(memory, self._HEAD)[0]
+                space_waiting = memory[self._SPACE_WAITING]
+                memory[self._SPACE_WAITING] = 0
+            if space_waiting:
+                self._space.release()
+        return count
+
+    def wait(self, timeout):
+        """ Sleep until a message is written, wake is called or timeout seconds have elapsed """
+        counter = self._COUNTER
+        memory = self._memory
+        with self._lock:
+            if counter.unpack_from(memory, self._HEAD)[0] != counter.unpack_from(memory, self._TAIL)[0]:
+                return
+            memory[self._WAITING] = 1
+        self._signal.acquire(timeout=timeout)
+        with self._lock:
+            memory[self._WAITING] = 0
+
+    def wake(self):
+        self._signal.release()
+
+
+def decode_process(config, partition, partitions, channel, ring=None):
+    """ Main function of a decode process, forked by DecodeProcess
+
+    Receives ('decode', messages) and ('configure', config) requests on channel until None, and the messages written
+    to ring if there is one. Sends back (readings, commands) for messages decoded and held messages released, where
+    commands are the (topic, payload) of the messages the decoder asks to publish, such as rebirth requests.
+    """
+    commands = []
+    readings = []
+
+    def decode(topic, payload, receive_time):
+        readings.extend(decoder.decode(topic, payload, receive_time))
+
+    # The process is the plugin's own: the objects inherited from the south service are never garbage, and
+    # decoding creates no reference cycles, so young collections are made less often
+    gc.freeze()
+    gc.set_threshold(_PROCESS_GC_THRESHOLD, *gc.get_threshold()[1:])
+
+    snapshot = None
+    if config['birthSnapshot']['value'] == 'true':
+        snapshot = BirthSnapshot(snapshot_path(config, partition, partitions))
+    decoder = SparkplugDecoder(config, partitions, lambda topic, payload: commands.append((topic, payload)),
+                               snapshot)
+    try:
+        while True:
+            request = ()
+            if ring is None:
+                if channel.poll(decoder.wait_time(time.time())):
+                    request = channel.recv()
+            else:
+                if not ring.read(decode):
+                    wait = decoder.wait_time(time.time())
+                    ring.wait(_RING_POLL if wait is None else min(wait, _RING_POLL))
+                if channel.poll(0):
+                    request = channel.recv()
+            if request is None:
+                if ring is not None:
+                    ring.read(decode)
+                readings.extend(decoder.expire(None))
+                channel.send((readings, commands))
+                break
+            if request:
+                kind, value = request
+                if kind == 'configure':
+                    decoder.configure(value)
+                else:
+                    for item in value:
+                        decode(*item)
+            readings.extend(decoder.expire(time.time()))
+            if readings or commands:
+                channel.send((readings, commands))
+                del readings[:]
+                del commands[:]
+            if snapshot is not None:
+                snapshot.save_if_due(time.time())
+    except Exception as ex:
+        _LOGGER.error("Decode process {} failed: {}".format(partition + 1, str(ex)))
+    finally:
+        if snapshot is not None:
+            snapshot.save()
+        gaps, duplicates, reorders = decoder.sessions.sequence_counts()
+        if gaps or duplicates or reorders:
+            _LOGGER.info("Sparkplug seq: {} messages missed, {} received twice and {} received late.".format(
+                gaps, duplicates, reorders))
+        channel.close()
+
+
+class DecodeProcess(object):
+    """ A forked process decoding the messages of one partition of the edge nodes, see decode_process
+
+    Forking rather than spawning keeps the plugin modules, which cannot be imported again outside of the south
+    service, and avoids pickling the configuration.
+    """
+
+    __slots__ = ['process', 'channel', 'ring', '_child', '_send_lock']
+
+    def __init__(self, config, partition, partitions, ring=None):
+        context = multiprocessing.get_context('fork')
+        self.ring = ring
+        self.channel, self._child = context.Pipe()
+        self.process = context.Process(target=decode_process,
+                                       args=(config, partition, partitions, self._child, ring),
+                                       name="sparkplug-decoder-{}".format(partition), daemon=True)
+        self._send_lock = threading.Lock()
+
+    def start(self):
+        self.process.start()
+        # Only the child uses its end, so the parent sees the end of the pipe when the child exits
+        self._child.close()
+
+    def send(self, request):
+        """ Returns False if the process has exited """
+        try:
+            with self._send_lock:
+                self.channel.send(request)
+        except (BrokenPipeError, OSError):
+            return False
+        if self.ring is not None:
+            # The process may be asleep on its ring
+            self.ring.wake()
+        return True
+
+    def configure(self, config):
+        self.send(('configure', {key: item for key, item in config.items() if key != '_mqtt'}))
+
+
+class AsyncioPipeline(object):
+    """ Receive, decode, batch and ingest stages of the plugin as coroutines on its event loop
+
+    The loop runs in a thread of its own and drives the paho socket through the socket callbacks, so there is a
+    single scheduler. The stages are joined by bounded queues: a slow ingest fills the batches queue, which holds
+    the batch stage, which lets the decoded queue fill, which holds the decode stage. Once capacity messages are
+    waiting to be decoded, the socket is no longer read, leaving the broker to hold the messages. Report by exception
+    filtering is part of the decode stage.
+    """
+
+    __slots__ = ['client', 'loop', 'decoder', 'capacity', 'batch_size', 'batch_wait', 'received', 'decoded',
+                 'batches', 'socket', 'paused', 'stopping', 'tasks', 'timers', 'thread', '_thread_id']
+
+    def __init__(self, client, decoder, capacity, batch_size, batch_wait):
+        self.client = client
+        # Set by start to the event loop of the plugin
+        self.loop = None
+        self.decoder = decoder
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.received = None
+        self.decoded = None
+        self.batches = None
+        self.socket = None
+        self.paused = False
+        self.stopping = False
+        # The stage tasks, and those run every so often
+        self.tasks = []
+        self.timers = []
+        self.thread = None
+        self._thread_id = None
+
+    def resize(self, batch_size, batch_wait):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+
+    def start(self):
+        mqtt_client = self.client.mqtt_client
+        mqtt_client.on_message = self.on_message
+        mqtt_client.on_disconnect = self.on_disconnect
+        mqtt_client.on_socket_open = self.on_socket_open
+        mqtt_client.on_socket_close = self.on_socket_close
+        mqtt_client.on_socket_register_write = self.on_socket_register_write
+        mqtt_client.on_socket_unregister_write = self.on_socket_unregister_write
+        self.thread = threading.Thread(target=self.run_loop, name="sparkplug-asyncio", daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.run(), self.loop)
+
+    def run_loop(self):
+        self._thread_id = threading.get_ident()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def stop(self):
+        """ Disconnect and drain the stages, called from outside the loop """
+        if self.thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.thread = None
+
+    async def run(self):
+        self.received = asyncio.Queue()
+        self.decoded = asyncio.Queue(self.capacity)
+        self.batches = asyncio.Queue(2)
+        self.tasks = [self.loop.create_task(coroutine) for coroutine in (self.decode(), self.batch(), self.ingest())]
+        self.timers = [self.loop.create_task(self.keep_alive()), self.loop.create_task(self.report_statistics())]
+        await self.connect()
+
+    async def shutdown(self):
+        self.stopping = True
+        self.client.mqtt_client.disconnect()
+        # Give the broker a moment to close the connection, so that paho closes the socket
+        for _ in range(10):
+            if self.socket is None:
+                break
+            await asyncio.sleep(0.1)
+        if self.socket is not None:
+            self.unwatch(self.socket)
+        for timer in self.timers:
+            timer.cancel()
+        if self.received is not None:
+            await self.received.put(None)
+            await asyncio.gather(*self.tasks)
+        await asyncio.gather(*self.timers, return_exceptions=True)
+
+    async def connect(self):
+        """ Attempt to connect, in an executor thread as paho connects its socket in blocking mode """
+        if self.stopping:
+            return
+        try:
+            await self.loop.run_in_executor(None, self.client.mqtt_client.reconnect)
+        except Exception as ex:
+            self.client.statistics.connection_attempts += 1
+            self.client.statistics.connection_failures += 1
+            delay = self.client.backoff.next_delay()
+            _LOGGER.debug("Failed to connect to the MQTT broker: {}; next attempt in {:.1f} seconds.".format(
+                str(ex), delay))
+            self.loop.call_later(delay, self.reconnect)
+
+    def on_disconnect(self, client, userdata, rc):
+        self.client.statistics.connected = False
+        if self.stopping:
+            return
+        if rc != 0:
+            _LOGGER.warning("MQTT connection lost: {}.".format(mqtt.error_string(rc)))
+        self.loop.call_later(self.client.backoff.next_delay(), self.reconnect)
+
+    def reconnect(self):
+        if not self.stopping:
+            self.loop.create_task(self.connect())
+
+    def on_message(self, client, userdata, msg):
+        """ Receive stage, called by loop_read on the loop """
+        if self.client.statistics.first_message is None:
+            self.client.statistics.record_first_message()
+        self.received.put_nowait((msg.topic, msg.payload, time.time()))
+        if not self.paused and self.received.qsize() >= self.capacity and self.socket is not None:
+            self.paused = True
+            self.loop.remove_reader(self.socket)
+
+    async def decode(self):
+        decoder = self.decoder
+        snapshot = self.client.snapshot
+        while True:
+            wait = decoder.wait_time(time.time())
+            try:
+                if wait is None:
+                    item = await self.received.get()
+                else:
+                    item = await asyncio.wait_for(self.received.get(), wait)
+            except asyncio.TimeoutError:
+                item = ()
+            if item is None:
+                readings = decoder.expire(None)
+                if readings:
+                    await self.decoded.put(readings)
+                await self.decoded.put(None)
+                return
+            readings = decoder.decode(*item) if item else decoder.expire(time.time())
+            if self.paused and self.received.qsize() <= self.capacity // 2 and self.socket is not None:
+                self.paused = False
+                self.loop.add_reader(self.socket, self.client.mqtt_client.loop_read)
+            if readings:
+                await self.decoded.put(readings)
+            if snapshot is not None:
+                snapshot.save_if_due(time.time())
+
+    async def batch(self):
+        """ Collect readings into batches of at most batch_size, none waiting longer than batch_wait """
+        batch = []
+        deadline = None
+        while True:
+            try:
+                if deadline is None:
+                    readings = await self.decoded.get()
+                else:
+                    readings = await asyncio.wait_for(self.decoded.get(), max(0.0, deadline - self.loop.time()))
+            except asyncio.TimeoutError:
+                readings = ()
+            if readings is None:
+                if batch:
+                    await self.batches.put(batch)
+                await self.batches.put(None)
+                return
+            if readings:
+                if not batch:
+                    deadline = self.loop.time() + self.batch_wait
+                batch.extend(readings)
+            while len(batch) >= self.batch_size:
+                await self.batches.put(batch[:self.batch_size])
+                batch = batch[self.batch_size:]
+            if batch and self.loop.time() >= deadline:
+                await self.batches.put(batch)
+                batch = []
+            if not batch:
+                deadline = None
+
+    async def ingest(self):
+        while True:
+            batch = await self.batches.get()
+            if batch is None:
+                return
+            try:
+                ingest_readings(batch)
+            except Exception as ex:
+                _LOGGER.error("Failed to ingest {} readings: {}".format(len(batch), str(ex)))
+
+    async def keep_alive(self):
+        """ Let paho send its pings and notice a dead connection """
+        while not self.stopping:
+            self.client.mqtt_client.loop_misc()
+            await asyncio.sleep(1)
+
+    async def report_statistics(self):
+        timestamps = TimestampFormatter()
+        while not self.stopping:
+            await asyncio.sleep(self.client.statistics_interval)
+            if self.client.statistics_asset and not self.stopping:
+                await self.decoded.put([{'asset': self.client.statistics_asset,
+                                         'timestamp': timestamps.seconds(time.time()),
+                                         'readings': self.client.statistics.values(self.client)}])
+
+    def call(self, function, *args):
+        """ Call function on the loop: at once if already there, as the socket may be closed right after """
+        if threading.get_ident() == self._thread_id:
+            function(*args)
+        else:
+            self.loop.call_soon_threadsafe(function, *args)
+
+    def on_socket_open(self, client, userdata, sock):
+        self.call(self.watch, sock)
+
+    def on_socket_close(self, client, userdata, sock):
+        self.call(self.unwatch, sock)
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.call(self.loop.add_writer, sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.call(self.loop.remove_writer, sock)
+
+    def watch(self, sock):
+        self.socket = sock
+        self.paused = False
+        self.loop.add_reader(sock, self.client.mqtt_client.loop_read)
+
+    def unwatch(self, sock):
+        if sock.fileno() >= 0:
+            self.loop.remove_reader(sock)
+            self.loop.remove_writer(sock)
+        if self.socket is sock:
+            self.socket = None
+
+
 class MqttSubscriberClient(object):
     """ mqtt subscriber """
 
-    __slots__ = ['mqtt_client', 'broker_host', 'broker_port', 'username', 'password', 'topic',
-                 'asset_name', 'asset_naming', 'topic_fragments', 'attach_topic_datapoint', 'datapoints', 'loop']
+    __slots__ = ['mqtt_client', 'broker_host', 'broker_port', 'username', 'password', 'topics', 'share_group',
+                 'loop', 'batcher', 'queues', 'decoders', 'workers', 'snapshot', 'backoff', 'statistics',
+                 'statistics_asset', 'statistics_interval', '_stopped', 'processes', 'rings', 'pipeline']
 
     def __init__(self, config):
         self.mqtt_client = mqtt.Client()
@@ -263,97 +1502,130 @@ class MqttSubscriberClient(object):
         self.broker_port = int(config['port']['value'])
         self.username = config['user']['value']
         self.password = config['password']['value']
-        self.asset_name = config['assetName']['value'].strip()
-        self.asset_naming = config['assetNaming']['value']
-        self.topic = config['topic']['value']
-        self.topic_fragments = config['topicFragments']['value'].lower()
-        self.attach_topic_datapoint = config['attachTopicDatapoint']['value']
-        self.datapoints = config['datapoints']['value']
+        self.topics = [settings['topic'] for settings in subscription_settings(config)]
+        self.share_group = config['sharedSubscriptionGroup']['value'].strip()
+        if self.share_group and int(config['reorderWindow']['value']):
+            _LOGGER.warning("The reorder window is not used with a shared subscription group, as each member of the "
+                            "group only receives some of the messages of an edge node.")
+        self.batcher = ReadingsBatcher(ingest_readings, int(config['batchSize']['value']),
+                                       int(config['batchTimeout']['value']) / 1000)
+        # One bounded queue and one decoder per worker; messages of an edge node always go to the same worker
+        # The asyncio pipeline has a single decode stage, and queues, of its own
+        asyncio_pipeline = config['pipeline']['value'] == 'Asyncio'
+        process_count = 0 if asyncio_pipeline else int(config['decodeProcesses']['value'])
+        worker_count = 1 if asyncio_pipeline else process_count or int(config['decodeWorkers']['value'])
+        self.queues = [WorkQueue(int(config['queueSize']['value']), config['queueOverflow']['value'])
+                       for _ in range(worker_count)]
+        self.snapshot = None
+        self.decoders = []
+        # With decode processes, messages reach each process through its own shared memory ring, or else a worker
+        # thread forwards the messages of its queue to it
+        ring_size = int(config['sharedMemorySize']['value']) * 1024 if process_count else 0
+        self.rings = [SharedRing(ring_size, config['queueOverflow']['value'])
+                      for _ in range(process_count)] if ring_size else []
+        if self.rings and config['queueOverflow']['value'] == 'Drop oldest':
+            _LOGGER.warning("Messages that do not fit in the shared memory of a decode process are dropped as they "
+                            "are received; the oldest messages cannot be dropped in their place.")
+        if self.rings or asyncio_pipeline:
+            self.queues = []
+        self.processes = [DecodeProcess(config, index, process_count, self.rings[index] if self.rings else None)
+                          for index in range(process_count)]
+        if not process_count:
+            if config['birthSnapshot']['value'] == 'true':
+                self.snapshot = BirthSnapshot(snapshot_path(config))
+            self.decoders = [SparkplugDecoder(config, worker_count, self.publish, self.snapshot)
+                             for _ in range(worker_count)]
+        self.pipeline = None
+        if asyncio_pipeline:
+            self.pipeline = AsyncioPipeline(self, self.decoders[0], int(config['queueSize']['value']),
+                                            int(config['batchSize']['value']),
+                                            int(config['batchTimeout']['value']) / 1000)
+        self.workers = []
+        self.backoff = ReconnectBackoff(1, 120, 0.5)
+        self.statistics = ClientStatistics()
+        self.statistics_asset = ''
+        self.statistics_interval = 60
+        self._stopped = threading.Event()
+        self.configure(config)
+
+    def configure(self, config):
+        """ Apply the reconnect and statistics settings """
+        self.backoff.min_delay = int(config['reconnectMinDelay']['value'])
+        self.backoff.max_delay = max(int(config['reconnectMaxDelay']['value']), self.backoff.min_delay)
+        self.backoff.jitter = int(config['reconnectJitter']['value']) / 100
+        self.statistics_asset = config['statisticsAsset']['value'].strip()
+        self.statistics_interval = int(config['statisticsInterval']['value'])
+        if self.share_group and config['reportByException']['value'] != 'Disabled':
+            _LOGGER.warning("Report by exception is not used with a shared subscription group, as the last value of "
+                            "a metric may have been received by another member of the group.")
 
     def on_connect(self, client, userdata, flags, rc):
         """ The callback for when the client receives a CONNACK response from the server """
+        self.statistics.connection_attempts += 1
+        if rc != 0:
+            self.statistics.connection_failures += 1
+            _LOGGER.error("MQTT connection refused: {}.".format(mqtt.connack_string(rc)))
+            return
+        self.statistics.connected = True
+        self.backoff.reset()
 
-        if self.validate_topic():
+        topics = []
+        for topic in self.topics:
+            if self.validate_topic(topic):
+                topics.append(topic)
+            else:
+                _LOGGER.error("Invalid topic: {}.".format(topic))
+        if self.share_group:
+            if any(c in self.share_group for c in '/+#'):
+                _LOGGER.error("Invalid shared subscription group: {}.".format(self.share_group))
+                return
+            # The broker delivers each data message to one member of the group, messages still carry their own topic
+            topics = shared_subscription_filters(topics, self.share_group)
+        if topics:
             client.connected_flag = True
-            # subscribe at given Topic on connect
-            client.subscribe(self.topic)
-            _LOGGER.info("MQTT connection established. Subscribed to topic: {}".format(self.topic))
-        else:
-            _LOGGER.error("Invalid topic: {}.".format(self.topic))
+            # subscribe at given Topics on connect
+            client.subscribe([(topic, 0) for topic in topics])
+            _LOGGER.info("MQTT connection established. Subscribed to topics: {}".format(", ".join(topics)))
+
+    def on_connect_fail(self, client, userdata):
+        """ The callback for when the connection to the broker could not be established """
+        self.statistics.connection_attempts += 1
+        self.statistics.connection_failures += 1
+        self.schedule_reconnect(client)
 
     def on_disconnect(self, client, userdata, rc):
-        pass
+        self.statistics.connected = False
+        if rc != 0:
+            _LOGGER.warning("MQTT connection lost: {}.".format(mqtt.error_string(rc)))
+        self.schedule_reconnect(client)
+
+    def schedule_reconnect(self, client):
+        """ Set the wait of the paho network loop before its next attempt to connect """
+        delay = self.backoff.next_delay()
+        # With equal bounds, paho waits exactly this long before the next attempt
+        client.reconnect_delay_set(delay, delay)
+        _LOGGER.debug("Next attempt to connect to the MQTT broker in {:.1f} seconds.".format(delay))
 
     def on_message(self, client, userdata, msg):
-        """ The callback for when a PUBLISH message is received from the server """
+        """ The callback for when a PUBLISH message is received from the server
 
-        _LOGGER.debug("MQTT message received - Topic: {}, Payload: {}".format(
-            str(msg.topic), str(msg.payload)))
-        try:
-            # Protobuf message structure
-            sparkplug_payload = sparkplug_b_pb2.Payload()
-            sparkplug_payload.ParseFromString(msg.payload)
+        Runs on the paho network thread, so it only hands the message over to a decode worker.
+        """
+        if self.statistics.first_message is None:
+            self.statistics.record_first_message()
+        topic = msg.topic
+        rings = self.rings
+        if rings:
+            ring = rings[partition_index(topic, len(rings))] if len(rings) > 1 else rings[0]
+            ring.put(topic, msg.payload, time.time())
+            return
+        queues = self.queues
+        index = partition_index(topic, len(queues)) if len(queues) > 1 else 0
+        queues[index].put((topic, msg.payload, time.time()))
 
-            device_readings = {}
-            for metric in sparkplug_payload.metrics:
-                value = "Unknown"
-                if metric.HasField("boolean_value"):
-                    """ bool value cast to int as internal. See FOGL-8067 """
-                    value = metric.boolean_value
-                elif metric.HasField("float_value"):
-                    value = metric.float_value
-                elif metric.HasField("double_value"):
-                    value = metric.double_value
-                # Handle signed and unsigned integer types
-                elif metric.HasField("int_value"):
-                    # Set data_type to metric.datatype if it exists, otherwise default to 3 (Int32)
-                    data_type = metric.datatype if metric.HasField("datatype") else 3
-
-                    # If data_type is less than 4 (Int8, Int16, Int32), treat as signed integer
-                    # Convert the value using ctypes.c_int for proper signed handling
-                    if data_type < 4:  # Signed integers: Int8, Int16, Int32
-                        value = ctypes.c_int(metric.int_value).value
-                    else:
-                        # For other integer types (e.g., unsigned integers), use the raw int_value
-                        # This acts as a fallback for default unsigned values
-                        value = metric.int_value  
-
-                # Handle long integer types (64-bit integers)
-                elif metric.HasField("long_value"):
-                    # Set data_type to metric.datatype if it exists, otherwise default to 4 (Int64)
-                    data_type = metric.datatype if metric.HasField("datatype") else 4
-
-                    # If data_type is 4, treat as a signed 64-bit integer (Int64)
-                    # Convert the value using ctypes.c_long for proper signed handling
-                    if data_type == 4:  # Int64
-                        value = ctypes.c_long(metric.long_value).value
-                    else:
-                        # For other long types (e.g., unsigned long), use the raw long_value
-                        # This acts as a fallback for default unsigned values
-                        value = metric.long_value 
-                elif metric.HasField("string_value"):
-                    value = metric.string_value
-                # TODO: FOGL-9302, FOGL-9198 - Handle other data types
-                if value == "Unknown":
-                    _LOGGER.warning("Ignoring metric '{}' due to unknown type. Only supported types are: "
-                                    "float, double, unsigned integer's, string, bool.".format(metric.name))
-                    continue
-                if self.datapoints == "Per metric":
-                    self.save({metric.name: value}, datetime.fromtimestamp(
-                        metric.timestamp, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%s'))
-                else:
-                    device_readings.update({metric.name: value})
-            if self.datapoints == 'Per device':
-                self.save(device_readings, utils.local_timestamp())
-        except KeyError as err:
-            _LOGGER.error(err, "Check the topic fragments, and ensure that placeholders are replaced with values "
-                               "such as group_id, message_type, edge_node_id, or device_id.")
-        except ValueError as err:
-            _LOGGER.error(err)
-        except Exception as ex:
-            msg = ("Message payload must comply with {} standards. Please ensure that the format and structure "
-                   "of the payload adhere to the specified requirements.".format(NAMESPACE))
-            _LOGGER.error(ex, msg)
+    def publish(self, topic, payload):
+        """ Publish a command, such as a rebirth request, from a decode worker """
+        self.mqtt_client.publish(topic, payload, qos=0)
 
     def on_subscribe(self, client, userdata, mid, granted_qos):
         pass
@@ -366,80 +1638,1585 @@ class MqttSubscriberClient(object):
             self.mqtt_client.username_pw_set(self.username, password=self.password)
         # event callbacks
         self.mqtt_client.on_connect = self.on_connect
+        self.mqtt_client.on_connect_fail = self.on_connect_fail
         self.mqtt_client.on_subscribe = self.on_subscribe
         self.mqtt_client.on_message = self.on_message
         self.mqtt_client.on_disconnect = self.on_disconnect
-        self.mqtt_client.connect(self.broker_host, self.broker_port)
+        self.statistics.started = time.monotonic()
+        # The paho network thread connects, and keeps trying to, so that a broker that is down does not stop start
+        self.mqtt_client.connect_async(self.broker_host, self.broker_port)
         _LOGGER.info("Attempting to connect to MQTT broker at {}:{}...".format(self.broker_host,
                                                                                self.broker_port))
+        if self.pipeline is not None:
+            self.pipeline.loop = self.loop
+            self.pipeline.start()
+            return
 
+        # Fork the decode processes before any thread of the plugin is started
+        for process in self.processes:
+            process.start()
+        self.batcher.start()
+        for index, (queue, decoder) in enumerate(zip(self.queues, self.decoders)):
+            worker = threading.Thread(target=self.run_worker, args=(queue, decoder),
+                                      name="sparkplug-decoder-{}".format(index), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        for index, process in enumerate(self.processes):
+            targets = [(self.run_collector, "collector")]
+            if process.ring is None:
+                targets.append((self.run_forwarder, "forwarder"))
+            for target, name in targets:
+                worker = threading.Thread(target=target, args=(self.queues[index] if self.queues else None, process),
+                                          name="sparkplug-{}-{}".format(name, index), daemon=True)
+                worker.start()
+                self.workers.append(worker)
+        threading.Thread(target=self.report_statistics, name="sparkplug-statistics", daemon=True).start()
         self.mqtt_client.loop_start()
 
     def stop(self):
-        self.mqtt_client.disconnect()
-        self.mqtt_client.loop_stop()
+        self._stopped.set()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        else:
+            self.mqtt_client.disconnect()
+            self.mqtt_client.loop_stop()
+        # Let the workers drain their queues before the last batch is passed on
+        for queue in self.queues:
+            queue.close()
+        for process in self.processes:
+            if process.ring is not None:
+                process.send(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        for process in self.processes:
+            process.process.join()
+        dropped = sum(queue.dropped for queue in self.queues)
+        if dropped:
+            _LOGGER.warning("{} MQTT messages were dropped as the work queue was full.".format(dropped))
+        overflows = sum(ring.overflows for ring in self.rings)
+        if overflows:
+            _LOGGER.warning("{} MQTT messages were dropped as the shared memory was full.".format(overflows))
+        if self.snapshot is not None:
+            self.snapshot.save()
+        gaps, duplicates, reorders = (sum(counts) for counts in zip(
+            (0, 0, 0), *(decoder.sessions.sequence_counts() for decoder in self.decoders)))
+        if gaps or duplicates or reorders:
+            _LOGGER.info("Sparkplug seq: {} messages missed, {} received twice and {} received late.".format(
+                gaps, duplicates, reorders))
+        # Pass on whatever is still waiting in the batch
+        self.batcher.stop()
 
-    def save(self, readings, ts):
-        if self.asset_naming == 'Topic Fragments':
-            asset = self.construct_asset_naming_topic_fragments()
-        elif self.asset_naming == 'Topic':
-            asset = self.topic
-        elif self.asset_naming == 'Asset Name':
-            asset = self.asset_name or self.topic
-            if not self.asset_name:
-                _LOGGER.warning("Asset Name cannot be empty or consist only of whitespace. It has been replaced with the '{}' topic from the incoming MQTT message.".format(self.topic))
+    def reconfigure(self, config):
+        """ Apply a new configuration that only differs from the current one in items outside _RESTART_ITEMS """
+        self.configure(config)
+        self.batcher.resize(int(config['batchSize']['value']), int(config['batchTimeout']['value']) / 1000)
+        if self.pipeline is not None:
+            self.pipeline.resize(int(config['batchSize']['value']), int(config['batchTimeout']['value']) / 1000)
+        for decoder in self.decoders:
+            decoder.configure(config)
+        for process in self.processes:
+            process.configure(config)
 
-        if self.attach_topic_datapoint == "true":
-            readings.update({"SparkPlugB:Topic": self.topic})
-        data = {
-            'asset': asset,
-            'timestamp': ts,
-            'readings': readings
-        }
-        async_ingest.ingest_callback(c_callback, c_ingest_ref, data)
+    def report_statistics(self):
+        """ Pass on a statistics reading every statistics interval until stopped, if the statistics asset is set """
+        timestamps = TimestampFormatter()
+        while not self._stopped.wait(self.statistics_interval):
+            if self.statistics_asset:
+                self.batcher.add({'asset': self.statistics_asset, 'timestamp': timestamps.seconds(time.time()),
+                                  'readings': self.statistics.values(self)})
 
-    def validate_topic(self) -> bool:
-        # TODO: FOGL-9268 wildcard characters
-        # +: Matches a single level in the topic hierarchy.
-        # #: Matches all remaining levels in the topic hierarchy.
-        # FIXME: Once the issue in JIRA is resolved, validate the topic accordingly
-        return True
+    def run_worker(self, queue, decoder):
+        """ Decode loop of a worker thread, runs until its queue is closed and empty """
+        add = self.batcher.add
+        snapshot = self.snapshot
+        while True:
+            item = queue.get(decoder.wait_time(time.time()))
+            if item is None:
+                # Messages still held for reordering are decoded as they are
+                for reading in decoder.expire(None):
+                    add(reading)
+                return
+            if item is WorkQueue.EMPTY:
+                readings = decoder.expire(time.time())
+            else:
+                readings = decoder.decode(*item)
+            for reading in readings:
+                add(reading)
+            if snapshot is not None:
+                snapshot.save_if_due(time.time())
+
+    def run_forwarder(self, queue, process):
+        """ Hand the messages of a queue over to its decode process in batches, until the queue is closed """
+        while True:
+            item = queue.get()
+            batch = []
+            while item is not None and item is not WorkQueue.EMPTY:
+                batch.append(item)
+                if len(batch) == _PROCESS_BATCH:
+                    break
+                item = queue.get(0)
+            if batch and not process.send(('decode', batch)):
+                # The process has exited, see run_collector
+                queue.abandon()
+                return
+            if item is None:
+                process.send(None)
+                return
+
+    def run_collector(self, queue, process):
+        """ Pass on the readings sent back by a decode process, and publish its commands, until it exits
+
+        A process exiting before the client is stopped has failed; the messages of its edge nodes are then dropped
+        and counted, rather than left to fill its queue or ring and hold the MQTT network thread.
+        """
+        add = self.batcher.add
+        while True:
+            try:
+                readings, commands = process.channel.recv()
+            except (EOFError, OSError):
+                if not self._stopped.is_set():
+                    _LOGGER.error("Decode process {} has exited; the messages of its edge nodes are dropped until "
+                                  "the plugin is restarted.".format(process.process.name))
+                    if queue is not None:
+                        queue.abandon()
+                    if process.ring is not None:
+                        process.ring.close()
+                return
+            for reading in readings:
+                add(reading)
+            for topic, payload in commands:
+                self.publish(topic, payload)
 
+    def validate_topic(self, topic) -> bool:
+        """ Validate a topic filter against the Sparkplug B topic namespace
+
+        +: Matches a single level in the topic hierarchy.
+        #: Matches all remaining levels in the topic hierarchy.
+        """
         # Split the topic by '/'
-        components = self.topic.split('/')
+        components = topic.split('/')
 
-        # Rule 1: Topic must have at-least 4 or maximum 5 components, device_id is Optional
-        if len(components) < 4 or len(components) > 5:
+        # Rule 1: '#' is allowed only on its own as the last level, it stands for any remaining components
+        if components[-1] == '#':
+            components = components[:-1]
+            if len(components) < 1 or len(components) > 5:
+                return False
+        # Topic must have at-least 4 or maximum 5 components, device_id is Optional
+        elif len(components) < 4 or len(components) > 5:
             return False
 
         # Rule 2: Must start with "spBv1.0"
         if components[0] != NAMESPACE:
             return False
 
-        # Rule 3: No empty strings allowed in components
+        # Rule 3: No empty strings allowed in components and wildcards must occupy a whole component
         for component in components[1:]:  # Skip the "spBv1.0"
-            if not component:
+            if not component or '#' in component or ('+' in component and component != '+'):
                 return False
 
         # Rule 4: Valid message_type
-        valid_message_types = ["NBIRTH", "NDEATH", "DBIRTH", "DDEATH", "NDATA", "DDATA", "NCMD", "DCMD", "STATE"]
-        if components[2] not in valid_message_types:
+        if len(components) > 2 and components[2] != '+' and components[2] not in MESSAGE_TYPES:
+            return False
+        return True
+
+
+class TimestampFormatter(object):
+    """ Formats times as UTC reading timestamps, YYYY-MM-DD HH:MM:SS.ffffff+00:00
+
+    The date and time of the last second formatted is cached, so a payload full of metrics of the same second
+    formats the date only once. A formatter is not thread safe, each decoder has its own.
+    """
+
+    # Fraction and time zone suffix for each millisecond of a second
+    _MILLISECONDS = ['.{:03d}000+00:00'.format(millisecond) for millisecond in range(1000)]
+
+    __slots__ = ['_second', '_prefix']
+
+    def __init__(self):
+        self._second = None
+        self._prefix = None
+
+    def _date_time(self, second):
+        if second != self._second:
+            self._prefix = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(second))
+            self._second = second
+        return self._prefix
+
+    def milliseconds(self, timestamp):
+        """ Timestamp of a Sparkplug metric or payload, in milliseconds since epoch """
+        second, millisecond = divmod(timestamp, 1000)
+        return self._date_time(second) + self._MILLISECONDS[millisecond]
+
+    def seconds(self, timestamp):
+        """ Timestamp in seconds since epoch, as returned by time.time() """
+        second = int(timestamp)
+        microsecond = min(round((timestamp - second) * 1000000), 999999)
+        return '{}.{:06d}+00:00'.format(self._date_time(second), microsecond)
+
+
+def to_signed(value, bits):
+    """ Two's complement interpretation of the low bits of an unsigned protobuf integer """
+    sign = 1 << (bits - 1)
+    return ((value & ((sign << 1) - 1)) ^ sign) - sign
+
+
+# Width of the signed Sparkplug integer datatypes Int8, Int16, Int32 and Int64
+_SIGNED_BITS = {1: 8, 2: 16, 3: 32, 4: 64}
+
+
+def _int_value(metric, datatype):
+    # Without a datatype int_value is taken as Int32; Int8, Int16 and Int32 are sign extended from their own width
+    value = metric.int_value
+    bits = _SIGNED_BITS.get(datatype or 3)
+    return value if bits is None else to_signed(value, bits)
+
+
+def _long_value(metric, datatype):
+    # Without a datatype long_value is taken as Int64, unsigned and DateTime values are used as they are
+    value = metric.long_value
+    bits = _SIGNED_BITS.get(datatype or 4)
+    return value if bits is None else to_signed(value, bits)
+
+
+# array typecode, None for a list of str, and DataSetValue field of the Sparkplug datatypes of DataSet columns
+_DATASET_COLUMNS = {
+    1: ('b', 'int_value'), 2: ('h', 'int_value'), 3: ('i', 'int_value'), 4: ('q', 'long_value'),
+    5: ('B', 'int_value'), 6: ('H', 'int_value'), 7: ('I', 'int_value'), 8: ('Q', 'long_value'),
+    9: ('d', 'float_value'), 10: ('d', 'double_value'), 11: ('B', 'boolean_value'), 12: (None, 'string_value'),
+    13: ('Q', 'long_value'), 14: (None, 'string_value'), 15: (None, 'string_value')
+}
+
+# Unsigned array typecode the signed integer columns are read into, as protobuf holds them unsigned
+_UNSIGNED_TYPECODES = {'b': 'I', 'h': 'I', 'i': 'I', 'q': 'Q'}
+
+
+def to_signed_array(values, unsigned, signed):
+    """ Two's complement array of the low bytes of unsigned protobuf integers, converted without a Python loop """
+    wide = array(unsigned, values)
+    narrow = array(signed)
+    step = wide.itemsize // narrow.itemsize
+    if step == 1:
+        narrow.frombytes(wide.tobytes())
+    else:
+        # Keep the low bytes of each value, they come first on little endian platforms
+        offset = 0 if sys.byteorder == 'little' else step - 1
+        narrow.frombytes(array(signed.upper(), wide.tobytes())[offset::step].tobytes())
+    return narrow
+
+
+def dataset_columns(dataset):
+    """ Column names and values of a DataSet
+
+    Each column is read at once according to its datatype into an array, or a list for string columns.
+    """
+    rows = [row.elements for row in dataset.rows]
+    columns = []
+    for index, datatype in enumerate(dataset.types):
+        typecode, field = _DATASET_COLUMNS.get(datatype, (None, None))
+        if field is None:
+            raise ValueError("DataSet column '{}' has unsupported datatype {}.".format(
+                dataset.columns[index], datatype))
+        values = list(map(attrgetter(field), map(itemgetter(index), rows)))
+        if typecode is None:
+            columns.append(values)
+        elif typecode in _UNSIGNED_TYPECODES:
+            columns.append(to_signed_array(values, _UNSIGNED_TYPECODES[typecode], typecode))
+        else:
+            columns.append(array(typecode, values))
+    return list(dataset.columns), columns
+
+
+def _dataset_value(metric, datatype):
+    # A datapoint per column holding its values as a list, as Fledge takes array datapoints as lists rather than
+    # arrays; Boolean columns as lists of bool, string columns, which are not array datapoints, as JSON text
+    dataset = metric.dataset_value
+    names, columns = dataset_columns(dataset)
+    values = {}
+    for name, column, column_type in zip(names, columns, dataset.types):
+        if column_type == 11:
+            values[name] = list(map(bool, column))
+        elif isinstance(column, array):
+            values[name] = column.tolist()
+        else:
+            values[name] = json.dumps(column)
+    return values
+
+
+# array typecode of the Sparkplug 3.0 array datatypes packed little endian into bytes_value
+_ARRAY_TYPECODES = {22: 'b', 23: 'h', 24: 'i', 25: 'q', 26: 'B', 27: 'H', 28: 'I', 29: 'Q', 30: 'f', 31: 'd',
+                    34: 'Q'}
+
+# Booleans of each byte of a BooleanArray, most significant bit first
+_BYTE_BITS = [tuple(bool(byte >> (7 - bit) & 1) for bit in range(8)) for byte in range(256)]
+
+
+def unpack_array(data, datatype):
+    """ Values of a Sparkplug 3.0 array datatype packed into bytes, None if datatype is not an array datatype
+
+    Numeric arrays are read through a memoryview cast of the bytes, so no Python code runs per element.
+    """
+    typecode = _ARRAY_TYPECODES.get(datatype)
+    if typecode is not None:
+        if len(data) % array(typecode).itemsize:
+            raise ValueError("Array of datatype {} has a size of {} bytes, which is not a whole number of "
+                             "elements.".format(datatype, len(data)))
+        if sys.byteorder == 'little':
+            return memoryview(data).cast(typecode).tolist()
+        values = array(typecode, data)
+        values.byteswap()
+        return values.tolist()
+    if datatype == 32:
+        # BooleanArray: number of booleans as a 4 byte little endian integer, then the packed bits
+        count = int.from_bytes(data[:4], 'little')
+        return list(chain.from_iterable(map(_BYTE_BITS.__getitem__, data[4:])))[:count]
+    if datatype == 33:
+        # StringArray: null terminated UTF-8 strings
+        values = bytes(data).decode('utf-8').split('\0')
+        if values and not values[-1]:
+            values.pop()
+        return values
+    return None
+
+
+def _bytes_value(metric, datatype):
+    # Bytes and File content is passed as base64 text, string arrays, which are not array datapoints, as JSON text
+    if datatype == 17 or datatype == 18:
+        return base64.b64encode(metric.bytes_value).decode('ascii')
+    values = unpack_array(metric.bytes_value, datatype)
+    return json.dumps(values) if datatype == 33 else values
+
+
+# Converter of each supported member of the Metric value oneof, called with the metric and its datatype.
+# A converter returns None if it does not support the datatype of the metric
+_VALUE_CONVERTERS = {
+    # bool value cast to int as internal. See FOGL-8067
+    'boolean_value': lambda metric, datatype: metric.boolean_value,
+    'float_value': lambda metric, datatype: metric.float_value,
+    'double_value': lambda metric, datatype: metric.double_value,
+    'int_value': _int_value,
+    'long_value': _long_value,
+    'string_value': lambda metric, datatype: metric.string_value,
+    'dataset_value': _dataset_value,
+    'bytes_value': _bytes_value
+}
+
+
+def metric_value(metric, datatype):
+    """ Value of metric converted according to datatype, None if the value type is not supported """
+    converter = _VALUE_CONVERTERS.get(metric.WhichOneof("value"))
+    return None if converter is None else converter(metric, datatype)
+
+
+class AliasTable(object):
+    """ Alias to metric name and datatype lookup, built from the metrics of a BIRTH certificate
+
+    Edge nodes usually assign aliases sequentially from 0; such tables are kept as a list of names and a bytearray
+    of datatypes indexed by alias. Sparse aliases fall back to dictionaries. Names are interned as the same metric
+    names recur across edge nodes and devices. The datatypes of all the named metrics, aliased or not, are also kept
+    by name, as DATA messages should not repeat them.
+    """
+
+    __slots__ = ['_names', '_datatypes', '_named_datatypes']
+
+    def __init__(self, metrics):
+        self._named_datatypes = {sys.intern(metric.name): metric.datatype for metric in metrics
+                                 if metric.name and metric.datatype}
+        entries = [(metric.alias, sys.intern(metric.name), metric.datatype) for metric in metrics
+                   if metric.name and metric.HasField("alias")]
+        size = max(alias for alias, _, _ in entries) + 1 if entries else 0
+        if size <= 2 * len(entries):
+            self._names = [None] * size
+            self._datatypes = bytearray(size)
+        else:
+            self._names = {}
+            self._datatypes = {}
+        for alias, name, datatype in entries:
+            self._names[alias] = name
+            self._datatypes[alias] = datatype if datatype < 256 else 0
+
+    def __len__(self):
+        return len(self._names)
+
+    def name(self, alias):
+        """ Metric name for alias, None if unknown """
+        try:
+            return self._names[alias]
+        except (IndexError, KeyError):
+            return None
+
+    def datatype(self, alias):
+        """ Metric datatype for alias, 0 (Unknown) if unknown """
+        try:
+            return self._datatypes[alias]
+        except (IndexError, KeyError):
+            return 0
+
+    def named_datatype(self, name):
+        """ Datatype of the metric named name, 0 (Unknown) if unknown """
+        return self._named_datatypes.get(name, 0)
+
+
+class TemplatePlan(object):
+    """ Flattening plan of a template definition
+
+    Holds for each member name its datapoint name suffix, its datatype and the plan of the template it is an
+    instance of, so instances are expanded into Instance/Member datapoints without walking the definition.
+    """
+
+    __slots__ = ['members']
+
+    # Plan of templates whose definition is unknown, members are flattened with what the instance carries
+    UNDEFINED = None
+
+    def __init__(self):
+        self.members = {}
+
+    @classmethod
+    def compile(cls, definitions):
+        """ Plans by template name of the template definition metrics of an NBIRTH certificate """
+        templates = {metric.name: metric.template_value for metric in definitions}
+        plans = {name: cls() for name in templates}
+        for name, template in templates.items():
+            members = plans[name].members
+            for member in template.metrics:
+                nested = None
+                if member.WhichOneof("value") == 'template_value':
+                    nested = plans.get(member.template_value.template_ref)
+                members[member.name] = ('/' + member.name, member.datatype, nested)
+        return plans
+
+    def flatten(self, prefix, template, values):
+        """ Add the Instance/Member datapoints of a template instance named prefix to values """
+        members = self.members
+        for member in template.metrics:
+            name = member.name
+            entry = members.get(name)
+            if entry is None:
+                entry = ('/' + name, 0, None)
+            suffix, datatype, nested = entry
+            field = member.WhichOneof("value")
+            if field == 'template_value':
+                (nested or TemplatePlan.UNDEFINED).flatten(prefix + suffix, member.template_value, values)
+                continue
+            converter = _VALUE_CONVERTERS.get(field)
+            value = None if converter is None else converter(member, member.datatype or datatype)
+            if value is not None:
+                values[prefix + suffix] = value
+        return values
+
+
+TemplatePlan.UNDEFINED = TemplatePlan()
+
+
+class EdgeNodeState(object):
+    """ Sparkplug session state of an edge node and its devices
+
+    Created on NBIRTH and dropped on NDEATH; device entries are created on DBIRTH and dropped on DDEATH.
+    """
+
+    __slots__ = ['aliases', 'devices', 'templates', 'unresolved']
+
+    def __init__(self, metrics=()):
+        self.aliases = AliasTable(metrics)
+        self.devices = {}
+        # TemplatePlan by template name, compiled from the definitions of the NBIRTH certificate
+        self.templates = TemplatePlan.compile([metric for metric in metrics
+                                               if metric.WhichOneof("value") == 'template_value'
+                                               and metric.template_value.is_definition])
+        self.unresolved = 0
+
+    def resolve(self, device_id, alias):
+        """ Metric name of alias for the device, or for the edge node itself if device_id is None """
+        if device_id is not None:
+            table = self.devices.get(device_id)
+            if table is not None:
+                name = table.name(alias)
+                if name is not None:
+                    return name
+        return self.aliases.name(alias)
+
+    def datatype(self, device_id, alias):
+        """ Datatype of alias for the device, or for the edge node itself if device_id is None """
+        if device_id is not None:
+            table = self.devices.get(device_id)
+            if table is not None:
+                datatype = table.datatype(alias)
+                if datatype:
+                    return datatype
+        return self.aliases.datatype(alias)
+
+    def named_datatype(self, device_id, name):
+        """ Datatype of the metric named name for the device, or for the edge node itself if device_id is None """
+        if device_id is not None:
+            table = self.devices.get(device_id)
+            if table is not None:
+                datatype = table.named_datatype(name)
+                if datatype:
+                    return datatype
+        return self.aliases.named_datatype(name)
+
+
+class NodeSession(object):
+    """ Session of an edge node """
+
+    __slots__ = ['online', 'bd_seq', 'last_seen', 'generation', 'devices', 'seq', 'gaps', 'duplicates',
+                 'reorders']
+
+    def __init__(self):
+        self.online = False
+        self.bd_seq = None
+        self.last_seen = None
+        # Last message seq, and counts of messages missed, received twice and received late
+        self.seq = None
+        self.gaps = 0
+        self.duplicates = 0
+        self.reorders = 0
+        # Incremented by each birth and death of the edge node, devices born in an earlier generation are stale
+        self.generation = 0
+        # DeviceSession by device_id
+        self.devices = {}
+
+
+class DeviceSession(object):
+    """ Session of a device, online only while its generation is the one of its edge node """
+
+    __slots__ = ['online', 'last_seen', 'generation']
+
+    def __init__(self):
+        self.online = False
+        self.last_seen = None
+        self.generation = 0
+
+
+class SessionTracker(object):
+    """ Online state, bdSeq and last seen time of edge nodes and their devices, keyed by group_id/edge_node_id
+
+    Every update is O(1): the death or rebirth of an edge node makes all of its devices stale at once by moving the
+    node to a new generation, rather than by visiting them.
+    """
+
+    __slots__ = ['nodes']
+
+    def __init__(self):
+        # NodeSession by group_id/edge_node_id
+        self.nodes = {}
+
+    def _node(self, node_key):
+        node = self.nodes.get(node_key)
+        if node is None:
+            node = self.nodes[node_key] = NodeSession()
+        return node
+
+    def _device(self, node, device_id):
+        device = node.devices.get(device_id)
+        if device is None:
+            device = node.devices[device_id] = DeviceSession()
+        return device
+
+    def birth(self, node_key, device_id, bd_seq, now):
+        """ Record an NBIRTH, or a DBIRTH if device_id is given """
+        node = self._node(node_key)
+        node.last_seen = now
+        if device_id is None:
+            node.online = True
+            node.bd_seq = bd_seq
+            node.generation += 1
+            return
+        device = self._device(node, device_id)
+        device.online = True
+        device.last_seen = now
+        device.generation = node.generation
+
+    def death(self, node_key, device_id, bd_seq, now):
+        """ Record an NDEATH, or a DDEATH if device_id is given
+
+        Returns False if the certificate does not end the current session: the edge node or device is already
+        offline, or the bdSeq of the NDEATH is not the one of the NBIRTH, as with the late Will message of an
+        earlier connection.
+        """
+        node = self._node(node_key)
+        if device_id is None:
+            if not node.online or (bd_seq is not None and node.bd_seq is not None and bd_seq != node.bd_seq):
+                return False
+            node.online = False
+            node.last_seen = now
+            node.generation += 1
+            return True
+        node.last_seen = now
+        device = self._device(node, device_id)
+        device.last_seen = now
+        if not self.device_online(node, device):
             return False
+        device.online = False
+        return True
 
-    def construct_asset_naming_topic_fragments(self):
-        components = self.topic.split('/')
-        template = self.topic_fragments
-        topic_items = {
-            "namespace": NAMESPACE,
-            "group_id": components[1],
-            "message_type": components[2],
-            "edge_node_id": components[3],
-            "device_id": ""
-        }
-        if len(components) == 5:
-            topic_items.update({"device_id": components[4]})
+    def restore(self, node_key, bd_seq):
+        """ Record an edge node whose BIRTH certificate was received before the plugin restarted """
+        node = self._node(node_key)
+        node.online = True
+        node.bd_seq = bd_seq
+
+    def seen(self, node_key, device_id, now):
+        """ Record a DATA message """
+        node = self._node(node_key)
+        node.last_seen = now
+        if device_id is not None:
+            self._device(node, device_id).last_seen = now
+
+    def sequence(self, node_key, seq, birth=False):
+        """ Check the seq of a message from the edge node against the last one, returns the number of messages missed
+
+        seq counts from 0 to 255 and wraps around. A seq up to 127 ahead of the last one is a gap, one behind it a
+        late message; neither moves the last seq backwards. An NBIRTH starts the count again.
+        """
+        node = self._node(node_key)
+        last = node.seq
+        if birth or last is None:
+            node.seq = seq
+            return 0
+        delta = (seq - last) & 0xFF
+        if delta == 1:
+            node.seq = seq
+            return 0
+        if delta == 0:
+            node.duplicates += 1
+            return 0
+        if delta < 128:
+            node.seq = seq
+            node.gaps += delta - 1
+            return delta - 1
+        node.reorders += 1
+        return 0
+
+    def sequence_counts(self):
+        """ Messages missed, received twice and received late, over all edge nodes """
+        nodes = self.nodes.values()
+        return (sum(node.gaps for node in nodes), sum(node.duplicates for node in nodes),
+                sum(node.reorders for node in nodes))
+
+    @staticmethod
+    def device_online(node, device):
+        return device.online and device.generation == node.generation
+
+    def online(self, node_key, device_id=None):
+        node = self.nodes.get(node_key)
+        if node is None:
+            return False
+        if device_id is None:
+            return node.online
+        device = node.devices.get(device_id)
+        return device is not None and self.device_online(node, device)
+
+
+def bd_seq(payload):
+    """ The bdSeq metric of an NBIRTH or NDEATH payload, None if there is none """
+    for metric in payload.metrics:
+        if metric.name == 'bdSeq':
+            return metric.long_value or metric.int_value
+    return None
+
+
+class ReorderWindow(object):
+    """ Messages of an edge node held until the ones before them arrive """
+
+    __slots__ = ['expected', 'pending', 'deadline']
+
+    def __init__(self):
+        # Next seq to be released, None until a message has been released
+        self.expected = None
+        # Held messages by seq
+        self.pending = {}
+        self.deadline = None
+
+
+class ReorderBuffer(object):
+    """ Releases the messages of each edge node in the order of their seq
+
+    A message ahead of the next expected seq is held until the missing ones arrive. The missing messages are given
+    up on once the first message held has waited max_wait seconds, releasing all those held, or once more than
+    max_messages are held, releasing those up to the next gap. A late message, whose seq has been given up on, is
+    released at once.
+    """
+
+    __slots__ = ['max_wait', 'max_messages', 'windows', 'waiting']
+
+    def __init__(self, max_wait, max_messages):
+        self.max_wait = max_wait
+        self.max_messages = max_messages
+        # ReorderWindow by group_id/edge_node_id
+        self.windows = {}
+        # The windows holding messages, by group_id/edge_node_id
+        self.waiting = {}
+
+    def add(self, node_key, seq, item, now, restart=False):
+        """ Returns the items released by adding item, in order
+
+        restart is set for NBIRTH and NDEATH, which start the seq count of the edge node again; seq is None for
+        NDEATH as it has none.
+        """
+        window = self.windows.get(node_key)
+        if window is None:
+            window = self.windows[node_key] = ReorderWindow()
+        if restart or window.expected is None:
+            released = self._release(node_key, window, len(window.pending))
+            released.append(item)
+            window.expected = None if seq is None else (seq + 1) & 0xFF
+            return released
+        delta = (seq - window.expected) & 0xFF
+        if delta == 0:
+            window.expected = (seq + 1) & 0xFF
+            released = [item]
+            self._release_run(node_key, window, released)
+            return released
+        if delta >= 128:
+            return [item]
+        window.pending[seq] = item
+        if window.deadline is None:
+            window.deadline = now + self.max_wait
+            self.waiting[node_key] = window
+        if len(window.pending) > self.max_messages:
+            return self._release(node_key, window, 1)
+        return []
+
+    def expire(self, now):
+        """ Release the messages that have waited long enough, or all of them if now is None """
+        released = []
+        for node_key, window in list(self.waiting.items()):
+            if now is None or window.deadline <= now:
+                released.extend(self._release(node_key, window, len(window.pending)))
+        return released
+
+    def wait_time(self, now):
+        """ Seconds until messages are due to be released, None if none are held """
+        if not self.waiting:
+            return None
+        return max(0.0, min(window.deadline for window in self.waiting.values()) - now)
+
+    def _release(self, node_key, window, gaps):
+        """ Give up on up to gaps runs of missing messages, returns the messages released """
+        released = []
+        expected = window.expected
+        pending = window.pending
+        while gaps and pending:
+            # Resume at the held message nearest to the expected seq
+            window.expected = min(pending, key=lambda seq: (seq - expected) & 0xFF)
+            self._release_run(node_key, window, released)
+            expected = window.expected
+            gaps -= 1
+        return released
+
+    def _release_run(self, node_key, window, released):
+        pending = window.pending
+        expected = window.expected
+        while expected in pending:
+            released.append(pending.pop(expected))
+            expected = (expected + 1) & 0xFF
+        window.expected = expected
+        if not pending and window.deadline is not None:
+            window.deadline = None
+            del self.waiting[node_key]
+
+
+class RebirthRequester(object):
+    """ Publishes Node Control/Rebirth commands, at most one per edge node every interval seconds """
+
+    __slots__ = ['publish', 'interval', 'requested']
+
+    def __init__(self, publish, interval):
+        self.publish = publish
+        self.interval = interval
+        # Time of the last request by group_id/edge_node_id
+        self.requested = {}
+
+    def request(self, group_id, edge_node_id, now):
+        """ Ask the edge node to publish its BIRTH certificates again, returns False if it was asked too recently """
+        key = group_id + '/' + edge_node_id
+        last = self.requested.get(key)
+        if last is not None and now - last < self.interval:
+            return False
+        self.requested[key] = now
+        payload = sparkplug_b_pb2.Payload()
+        payload.timestamp = int(now * 1000)
+        metric = payload.metrics.add()
+        metric.name = 'Node Control/Rebirth'
+        metric.timestamp = payload.timestamp
+        metric.datatype = 11
+        metric.boolean_value = True
+        topic = '/'.join((NAMESPACE, group_id, 'NCMD', edge_node_id))
+        _LOGGER.warning("Requesting a rebirth of edge node {}.".format(key))
+        self.publish(topic, payload.SerializeToString())
+        return True
+
+
+def birth_certificate(payload):
+    """ A copy of a BIRTH payload keeping only what decoding later messages needs
+
+    Metric values are dropped, except for bdSeq and template definitions.
+    """
+    certificate = sparkplug_b_pb2.Payload()
+    for metric in payload.metrics:
+        if metric.name == 'bdSeq' or (metric.WhichOneof("value") == 'template_value'
+                                      and metric.template_value.is_definition):
+            certificate.metrics.add().CopyFrom(metric)
+            continue
+        kept = certificate.metrics.add()
+        kept.name = metric.name
+        kept.datatype = metric.datatype
+        if metric.HasField('alias'):
+            kept.alias = metric.alias
+    return certificate.SerializeToString()
+
+
+class BirthSnapshot(object):
+    """ BIRTH certificates of edge nodes and devices kept in a file across restarts
+
+    The file is memory mapped when opened and only indexed; a certificate is parsed when its edge node is first
+    seen. It holds records of a header, packed as _RECORD, followed by the edge node key, the device_id and the
+    certificate, as returned by birth_certificate. Shared by the decoders of all the workers.
+    """
+
+    __slots__ = ['path', 'records', 'dirty', 'saved', '_lock', '_map']
+
+    _MAGIC = b'SPBS\x01'
+    # Edge node key length, device_id length or 0xFFFF for the edge node itself, certificate length
+    _RECORD = struct.Struct('<HHI')
+    _NODE = 0xFFFF
+
+    def __init__(self, path):
+        self.path = path
+        # Certificates by device_id, None for the edge node itself, by group_id/edge_node_id
+        self.records = {}
+        self.dirty = False
+        self.saved = time.time()
+        self._lock = threading.Lock()
+        self._map = None
+        try:
+            self._load()
+        except FileNotFoundError:
+            pass
+        except Exception as ex:
+            _LOGGER.warning("Ignoring the BIRTH certificates snapshot {}: {}".format(path, str(ex)))
+            self.records = {}
+
+    def _load(self):
+        with open(self.path, 'rb') as snapshot:
+            self._map = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        data = memoryview(self._map)
+        if data[:len(self._MAGIC)] != self._MAGIC:
+            raise ValueError("unknown format")
+        offset = len(self._MAGIC)
+        record = self._RECORD
+        while offset < len(data):
+            node_length, device_length, length = record.unpack_from(data, offset)
+            offset += record.size
+            node_key = str(data[offset:offset + node_length], 'utf-8')
+            offset += node_length
+            device_id = None
+            if device_length != self._NODE:
+                device_id = str(data[offset:offset + device_length], 'utf-8')
+                offset += device_length
+            if offset + length > len(data):
+                raise ValueError("truncated")
+            self.records.setdefault(node_key, {})[device_id] = data[offset:offset + length]
+            offset += length
+
+    def certificates(self, node_key):
+        """ Certificates by device_id, None for the edge node itself, of an edge node, None if there are none """
+        return self.records.get(node_key)
+
+    def record(self, node_key, device_id, payload):
+        """ Keep the certificate of a BIRTH payload, an NBIRTH replaces those of the devices of the edge node """
+        certificate = birth_certificate(payload)
+        with self._lock:
+            if device_id is None:
+                self.records[node_key] = {None: certificate}
+            else:
+                self.records.setdefault(node_key, {})[device_id] = certificate
+            self.dirty = True
+
+    def save_if_due(self, now):
+        if self.dirty and now - self.saved >= _SNAPSHOT_INTERVAL:
+            self.save()
+
+    def save(self):
+        """ Write the snapshot, replacing the file at once so that a crash never leaves it half written """
+        with self._lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            self.saved = time.time()
+            temporary = None
+            try:
+                directory, name = os.path.split(self.path)
+                os.makedirs(directory, exist_ok=True)
+                # A file of its own, in the same directory so that it replaces the snapshot at once
+                descriptor, temporary = tempfile.mkstemp(suffix='.tmp', prefix=name + '.', dir=directory)
+                with os.fdopen(descriptor, 'wb') as snapshot:
+                    snapshot.write(self._MAGIC)
+                    pack = self._RECORD.pack
+                    for node_key, certificates in self.records.items():
+                        node = node_key.encode('utf-8')
+                        for device_id, certificate in certificates.items():
+                            device = b'' if device_id is None else device_id.encode('utf-8')
+                            snapshot.write(pack(len(node), self._NODE if device_id is None else len(device),
+                                                len(certificate)))
+                            snapshot.write(node)
+                            snapshot.write(device)
+                            snapshot.write(certificate)
+                os.replace(temporary, self.path)
+            except Exception as ex:
+                _LOGGER.error("Failed to save the BIRTH certificates snapshot {}: {}".format(self.path, str(ex)))
+                if temporary is not None and os.path.exists(temporary):
+                    os.remove(temporary)
+
+
+def service_name():
+    """ Name of the south service running the plugin, from its --name argument, '' if it has none """
+    for arg in sys.argv:
+        if arg.startswith('--name='):
+            return arg[len('--name='):]
+    return ''
+
+
+def snapshot_path(config, partition=None, partitions=1):
+    """ Snapshot file of the plugin, named after the service, broker and topics so that each configuration has its own
+
+    Each decode process keeps the edge nodes of its partition in a file of its own.
+    """
+    service = service_name()
+    topics = [settings['topic'] for settings in subscription_settings(config)]
+    key = '\n'.join([service, config['url']['value'], config['port']['value']] + topics)
+    name = '{:08x}'.format(zlib.crc32(key.encode('utf-8')))
+    if service:
+        name = '{}-{}'.format(''.join(c if c.isalnum() else '_' for c in service), name)
+    if partition is not None:
+        name += '-{}of{}'.format(partition + 1, partitions)
+    data = _FLEDGE_DATA if _FLEDGE_DATA else _FLEDGE_ROOT + '/data'
+    return os.path.join(data, 'mqtt_sparkplug', name + '.birth')
+
+
+class AssetNamer(object):
+    """ Asset name of the readings built from the topic a message was received on
+
+    The Topic Fragments template is compiled once into positional format strings over the topic components, and
+    asset names are kept in a bounded LRU cache keyed by topic.
+    """
+
+    # Topic component index of each Topic Fragments placeholder
+    _FRAGMENTS = {"group_id": 1, "message_type": 2, "edge_node_id": 3, "device_id": 4}
+
+    __slots__ = ['asset_naming', 'asset_name', 'topic_fragments', '_formats', '_error', '_cache', '_cache_size']
+
+    def __init__(self, asset_naming, asset_name, topic_fragments, cache_size=_ASSET_CACHE_SIZE):
+        self.asset_naming = asset_naming
+        self.asset_name = asset_name
+        self.topic_fragments = topic_fragments
+        self._formats = None
+        self._error = None
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        if asset_naming == 'Topic Fragments':
+            try:
+                # Topics without device_id drop the device_id fragment
+                self._formats = {5: self._compile(topic_fragments),
+                                 4: self._compile(topic_fragments.replace("/{device_id}", ""))}
+            except (KeyError, ValueError) as err:
+                self._error = err
+                _LOGGER.error("Invalid topic fragments {}: {}".format(topic_fragments, err))
+
+    def _compile(self, template):
+        """ Turn the named placeholders of template into positional fields of the split topic """
+        parts = []
+        for literal, field, spec, conversion in string.Formatter().parse(template):
+            parts.append(literal.replace("{", "{{").replace("}", "}}"))
+            if field is None:
+                continue
+            if field == "namespace":
+                parts.append(NAMESPACE)
+                continue
+            parts.append("{" + str(self._FRAGMENTS[field]))
+            if conversion:
+                parts.append("!" + conversion)
+            if spec:
+                parts.append(":" + spec)
+            parts.append("}")
+        return "".join(parts)
+
+    def asset(self, topic):
+        cache = self._cache
+        asset = cache.get(topic)
+        if asset is not None:
+            cache.move_to_end(topic)
+            return asset
+        asset = self._asset(topic)
+        cache[topic] = asset
+        if len(cache) > self._cache_size:
+            cache.popitem(last=False)
+        return asset
+
+    def _asset(self, topic):
+        if self.asset_naming == 'Topic Fragments':
+            if self._error is not None:
+                raise self._error
+            components = topic.split('/')
+            template = self._formats.get(len(components))
+            if template is None:
+                raise ValueError("Topic {} does not follow the {} topic namespace.".format(topic, NAMESPACE))
+            return template.format(*components)
+        if self.asset_naming == 'Topic':
+            return topic
+        if not self.asset_name:
+            _LOGGER.warning("Asset Name cannot be empty or consist only of whitespace. It has been replaced with the "
+                            "'{}' topic from the incoming MQTT message.".format(topic))
+            return topic
+        return self.asset_name
+
+
+class DeadbandFilter(object):
+    """ Report by exception filter of metric values
+
+    The last value passed on is kept by edge node, device and metric name. A value is dropped when it equals that
+    value or, for numeric values with a deadband mode, is within the deadband of it; unless the heartbeat interval
+    has elapsed since it was passed on.
+    """
+
+    __slots__ = ['mode', 'deadband', 'heartbeat', '_nodes']
+
+    def __init__(self, mode, deadband, heartbeat):
+        self.mode = mode
+        self.deadband = deadband
+        self.heartbeat = heartbeat
+        # Last values by group_id/edge_node_id, then device_id (None for the edge node), then metric name
+        self._nodes = {}
+
+    def last_values(self, node_key, device_id):
+        """ Last values of the metrics of an edge node or device, to be passed to report """
+        devices = self._nodes.get(node_key)
+        if devices is None:
+            devices = self._nodes[node_key] = {}
+        values = devices.get(device_id)
+        if values is None:
+            values = devices[device_id] = {}
+        return values
+
+    def forget(self, node_key, device_id=None):
+        """ Drop the last values of an edge node and its devices, or of one of its devices """
+        if device_id is None:
+            self._nodes.pop(node_key, None)
         else:
-            template = template.replace("/{device_id}", "")
+            self._nodes.get(node_key, {}).pop(device_id, None)
+
+    def report(self, last_values, name, value, now):
+        """ Whether value of metric name, received at now, is to be passed on """
+        last = last_values.get(name)
+        if last is not None:
+            last_value, last_time = last
+            if (not self.heartbeat or now - last_time < self.heartbeat) and self.within(last_value, value):
+                return False
+        last_values[name] = (value, now)
+        return True
+
+    def within(self, last_value, value):
+        if value == last_value:
+            return True
+        if self.mode == 'Unchanged' or type(value) not in (int, float) or type(last_value) not in (int, float):
+            return False
+        if self.mode == 'Absolute deadband':
+            return abs(value - last_value) <= self.deadband
+        return abs(value - last_value) <= abs(last_value) * self.deadband / 100
+
+
+class MultiPartTransfer(object):
+    """ Parts received so far of a multi-part Bytes or File metric """
+
+    __slots__ = ['parts', 'received', 'size', 'md5', 'updated']
+
+    def __init__(self, metadata):
+        # Part bytes by MetaData.seq
+        self.parts = {}
+        self.received = 0
+        self.size = metadata.size
+        self.md5 = metadata.md5.lower()
+        self.updated = None
+
 
-        return template.format(**topic_items)
+class MultiPartAssembler(object):
+    """ Reassembles multi-part Bytes and File metrics, keyed by edge node, device and metric name
 
+    A transfer is complete once MetaData.size bytes have been received, and is then checked against MetaData.md5.
+    Parts of a transfer without a MetaData.size, which could never complete, are ignored. Incomplete transfers are
+    discarded timeout seconds after their last part, and the least recently updated ones are discarded while the
+    parts held exceed memory_limit bytes.
+    """
+
+    __slots__ = ['timeout', 'memory_limit', 'memory', '_transfers']
+
+    def __init__(self, timeout, memory_limit):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.memory = 0
+        # MultiPartTransfer by key, least recently updated first
+        self._transfers = OrderedDict()
+
+    def __len__(self):
+        return len(self._transfers)
+
+    def add(self, key, metadata, data, now):
+        """ Add a part received at now, returns the reassembled bytes once complete, otherwise None """
+        self.expire(now)
+        transfer = self._transfers.pop(key, None)
+        if transfer is None:
+            if not metadata.size:
+                _LOGGER.warning("Ignoring multi-part metric {}; its metadata has no size.".format(key))
+                return None
+            transfer = MultiPartTransfer(metadata)
+        if metadata.seq not in transfer.parts:
+            transfer.parts[metadata.seq] = data
+            transfer.received += len(data)
+            self.memory += len(data)
+        transfer.updated = now
+        if transfer.received >= transfer.size:
+            self.memory -= transfer.received
+            content = b''.join(transfer.parts[seq] for seq in sorted(transfer.parts))
+            if len(content) != transfer.size or (transfer.md5 and hashlib.md5(content).hexdigest() != transfer.md5):
+                _LOGGER.warning("Discarding multi-part metric {}; its content does not match the size or md5 of its "
+                                "metadata.".format(key))
+                return None
+            return content
+        self._transfers[key] = transfer
+        while self.memory > self.memory_limit and self._transfers:
+            self._discard("memory limit reached")
+        return None
+
+    def expire(self, now):
+        """ Discard the incomplete transfers whose last part was received timeout seconds or more before now """
+        while self._transfers and now - next(iter(self._transfers.values())).updated >= self.timeout:
+            self._discard("timed out")
+
+    def wait_time(self, now):
+        """ Seconds until the next incomplete transfer times out, None if there is none """
+        if not self._transfers:
+            return None
+        return max(0.0, next(iter(self._transfers.values())).updated + self.timeout - now)
+
+    def _discard(self, reason):
+        key, transfer = self._transfers.popitem(last=False)
+        self.memory -= transfer.received
+        _LOGGER.warning("Discarding incomplete multi-part metric {}; {}.".format(key, reason))
+
+
+class Subscription(object):
+    """ Readings structure settings of the messages received through a subscribed topic filter """
+
+    __slots__ = ['topic', 'asset_namer', 'datapoints']
+
+    def __init__(self, settings):
+        self.topic = settings['topic']
+        self.asset_namer = AssetNamer(settings['assetNaming'], settings['assetName'].strip(),
+                                      settings['topicFragments'].lower())
+        self.datapoints = settings['datapoints']
+
+
+class SparkplugDecoder(object):
+    """ Decodes Sparkplug B payloads into readings
+
+    Each decode worker owns its own decoder, which keeps per edge node state private to one thread. The readings
+    structure settings can be changed by configure while messages are being decoded; each message is decoded with
+    either the old or the new settings.
+    """
+
+    __slots__ = ['subscriptions', 'default_subscription', 'attach_topic_datapoint', 'edge_nodes', 'timestamps',
+                 'report_filter', 'dataset_rows', 'multipart', 'sessions', 'session_asset', 'rebirth', 'reorder',
+                 'snapshot', 'workers', 'publish', 'payload', 'reuse_payload', 'shared', '_lock']
+
+    def __init__(self, config, workers=1, publish=None, snapshot=None):
+        """ publish(topic, payload) sends a message to the broker, rebirths are not requested without it
+
+        snapshot is the BirthSnapshot recording and restoring the BIRTH certificates, if any.
+        """
+        self.workers = workers
+        self.publish = publish
+        self._lock = threading.Lock()
+        # Parsed into for each message, rather than allocating a Payload and its Metric objects per message. The upb
+        # backend only frees the memory of a message when it is deleted, so each message gets a new Payload with it.
+        # Created by the first message decoded.
+        self.reuse_payload = api_implementation.Type() != 'upb'
+        self.payload = None
+        # EdgeNodeState by group_id/edge_node_id
+        self.edge_nodes = {}
+        self.timestamps = TimestampFormatter()
+        self.sessions = SessionTracker()
+        self.snapshot = snapshot
+        # Members of a shared subscription group only receive some of the data messages of an edge node: their seq
+        # shows gaps that are not missed messages, and the parts of multi-part metrics and the values compared by
+        # report by exception are spread over the group. All of them receive the BIRTH and DEATH certificates.
+        self.shared = bool(config['sharedSubscriptionGroup']['value'].strip())
+        self.reorder = None
+        if not self.shared and int(config['reorderWindow']['value']):
+            self.reorder = ReorderBuffer(int(config['reorderWindow']['value']) / 1000,
+                                         int(config['reorderDepth']['value']))
+        self.multipart = None
+        self.rebirth = None
+        self.report_filter = None
+        self.configure(config)
+
+    def configure(self, config):
+        """ Apply the readings structure settings of config, keeping the session state """
+        # Readings structure settings of the subscriptions by topic filter
+        subscriptions = [Subscription(settings) for settings in subscription_settings(config)]
+        index = TopicFilterIndex()
+        for subscription in subscriptions:
+            index.add(subscription.topic, subscription)
+        mode = config['reportByException']['value']
+        deadband = float(config['deadband']['value'])
+        heartbeat = int(config['heartbeatInterval']['value'])
+        # The memory limit is shared out between the decoders of the workers
+        multipart_timeout = int(config['multipartTimeout']['value'])
+        multipart_memory = int(config['multipartMemory']['value']) * 1024 * 1024 // self.workers
+        with self._lock:
+            self.subscriptions = index
+            self.default_subscription = subscriptions[0]
+            self.attach_topic_datapoint = config['attachTopicDatapoint']['value']
+            self.dataset_rows = config['dataSets']['value'] == 'Rows'
+            self.session_asset = config['sessionAsset']['value'].strip()
+            if self.multipart is None:
+                self.multipart = MultiPartAssembler(multipart_timeout, multipart_memory)
+            else:
+                self.multipart.timeout = multipart_timeout
+                self.multipart.memory_limit = multipart_memory
+            if self.publish is None or config['rebirthRequests']['value'] != 'true':
+                self.rebirth = None
+            elif self.rebirth is None:
+                self.rebirth = RebirthRequester(self.publish, int(config['rebirthInterval']['value']))
+            else:
+                self.rebirth.interval = int(config['rebirthInterval']['value'])
+            if mode == 'Disabled' or self.shared:
+                self.report_filter = None
+            elif self.report_filter is None or self.report_filter.mode != mode:
+                self.report_filter = DeadbandFilter(mode, deadband, heartbeat)
+            else:
+                # The last values passed on still apply
+                self.report_filter.deadband = deadband
+                self.report_filter.heartbeat = heartbeat
+
+    def decode(self, topic, payload, receive_time):
+        """ Decode a message received on topic at receive_time (seconds since epoch) into a list of readings
+
+        With a reorder window, the readings may be those of earlier messages released by this one.
+        """
+
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("MQTT message received - Topic: {}, Payload: {}".format(str(topic), str(payload)))
+        with self._lock:
+            # Protobuf message structure, ParseFromString clears the payload of the previous message first
+            sparkplug_payload = self.payload
+            if sparkplug_payload is None:
+                sparkplug_payload = sparkplug_b_pb2.Payload()
+                if self.reuse_payload:
+                    self.payload = sparkplug_payload
+            try:
+                sparkplug_payload.ParseFromString(payload)
+            except Exception as ex:
+                msg = ("Message payload must comply with {} standards. Please ensure that the format and "
+                       "structure of the payload adhere to the specified requirements.".format(NAMESPACE))
+                _LOGGER.error(ex, msg)
+                return []
+            if self.reorder is None:
+                return self.decode_payload(topic, sparkplug_payload, receive_time)
+            return self.decode_reordered(topic, sparkplug_payload, receive_time)
+
+    def decode_reordered(self, topic, sparkplug_payload, receive_time):
+        """ Readings of the messages released by the reorder window once a parsed payload is added to it """
+        components = topic.split('/', 4)
+        message_type = components[2] if len(components) >= 4 else None
+        if message_type == 'NDEATH' or (message_type in _SEQUENCED_TYPES and sparkplug_payload.HasField('seq')):
+            seq = None if message_type == 'NDEATH' else sparkplug_payload.seq
+            item = (topic, sparkplug_payload, receive_time)
+            released = self.reorder.add(components[1] + '/' + components[3], seq, item, receive_time,
+                                        message_type == 'NBIRTH' or message_type == 'NDEATH')
+            if sparkplug_payload is self.payload and all(entry is not item for entry in released):
+                # Held until the messages before it arrive, the next message is parsed into a new payload
+                self.payload = None
+        else:
+            released = [(topic, sparkplug_payload, receive_time)]
+        if self.reorder.waiting:
+            released.extend(self.reorder.expire(receive_time))
+        readings = []
+        for item in released:
+            readings.extend(self.decode_payload(*item))
+        return readings
+
+    def expire(self, now):
+        """ Readings of the messages held for reordering that are due, or of all of them if now is None
+
+        Incomplete multi-part transfers that have timed out are discarded as well.
+        """
+        readings = []
+        with self._lock:
+            if now is not None:
+                self.multipart.expire(now)
+            if self.reorder is not None:
+                for item in self.reorder.expire(now):
+                    readings.extend(self.decode_payload(*item))
+        return readings
+
+    def wait_time(self, now):
+        """ Seconds until held messages are due or an incomplete multi-part transfer times out, None if neither """
+        waits = [wait for wait in (None if self.reorder is None else self.reorder.wait_time(now),
+                                   self.multipart.wait_time(now)) if wait is not None]
+        return min(waits) if waits else None
+
+    def decode_payload(self, topic, sparkplug_payload, receive_time):
+        """ Readings of a parsed payload """
+        readings = []
+        try:
+            components = topic.split('/', 4)
+            edge_node = self.update_session(components, sparkplug_payload, receive_time, readings)
+            if self.shared and len(components) >= 4 and components[2] in _SESSION_TYPES:
+                # Every member of the group receives the certificates, they only update its session state
+                return []
+            if (not self.shared and len(components) >= 4 and sparkplug_payload.HasField('seq')
+                    and components[2] in _SEQUENCED_TYPES):
+                missed = self.sessions.sequence(components[1] + '/' + components[3], sparkplug_payload.seq,
+                                                components[2] == 'NBIRTH')
+                if missed:
+                    _LOGGER.debug("{} messages missed before seq {} on topic {}.".format(
+                        missed, sparkplug_payload.seq, topic))
+                    self.request_rebirth(components, receive_time)
+            subscription = self.subscriptions.match(topic) or self.default_subscription
+            asset = subscription.asset_namer.asset(topic)
+            datapoints = subscription.datapoints
+            device_id = None
+            if len(components) == 5:
+                device_id = components[4]
+            node_key = components[1] + '/' + components[3] if len(components) >= 4 else topic
+            last_values = None
+            if self.report_filter is not None:
+                last_values = self.report_filter.last_values(node_key, device_id)
+
+            converters = _VALUE_CONVERTERS
+            timestamps = self.timestamps
+            device_readings = {}
+            # Readings by metric timestamp for 'Per timestamp', metrics without one take the payload timestamp, and
+            # those of a payload without one the receive time
+            timestamp_readings = {}
+            payload_timestamp = sparkplug_payload.timestamp
+            for metric in sparkplug_payload.metrics:
+                name = metric.name
+                datatype = metric.datatype
+                if not name:
+                    if not metric.HasField("alias"):
+                        _LOGGER.warning("Ignoring a metric without a name or an alias on topic {}.".format(topic))
+                        continue
+                    # Metric sent by alias only, resolve its name and datatype from the BIRTH certificate
+                    name = edge_node.resolve(device_id, metric.alias) if edge_node is not None else None
+                    if name is None:
+                        self.unresolved_alias(topic, edge_node, metric.alias)
+                        self.request_rebirth(components, receive_time)
+                        continue
+                    if not datatype:
+                        datatype = edge_node.datatype(device_id, metric.alias)
+                elif not datatype and edge_node is not None:
+                    # DATA metrics should not carry their datatype, it is that of the BIRTH certificate
+                    datatype = edge_node.named_datatype(device_id, name)
+                value_field = metric.WhichOneof("value")
+                if value_field == 'dataset_value' and self.dataset_rows:
+                    # Rows are not successive values of a metric, so are not reported by exception
+                    readings.extend(self.dataset_readings(asset, topic, metric, payload_timestamp, receive_time))
+                    continue
+                if value_field == 'template_value':
+                    # A template instance gives a datapoint per member, definitions are not data
+                    values = self.template_datapoints(edge_node, name, metric.template_value, last_values,
+                                                      receive_time)
+                    if not values:
+                        continue
+                else:
+                    if value_field == 'bytes_value' and metric.metadata.is_multi_part:
+                        if self.shared:
+                            _LOGGER.debug("Ignoring part of multi-part metric '{}' on topic {}; its parts are spread "
+                                          "over the shared subscription group.".format(name, topic))
+                            continue
+                        content = self.multipart.add((node_key, device_id, name), metric.metadata,
+                                                     metric.bytes_value, receive_time)
+                        if content is None:
+                            continue
+                        value = base64.b64encode(content).decode('ascii')
+                    else:
+                        converter = converters.get(value_field)
+                        value = None if converter is None else converter(metric, datatype)
+                    # TODO: FOGL-9302, FOGL-9198 - Handle other data types
+                    if value is None:
+                        _LOGGER.warning("Ignoring metric '{}' due to unknown type. Only supported types are: "
+                                        "float, double, integer's, string, bool, bytes, file, arrays, "
+                                        "DataSet, Template.".format(name))
+                        continue
+                    if last_values is not None and not self.report_filter.report(last_values, name, value,
+                                                                                 receive_time):
+                        continue
+                    values = {name: value}
+                if datapoints == "Per metric":
+                    readings.append(self.make_reading(asset, topic, values, self.reading_timestamp(
+                        metric.timestamp or payload_timestamp, receive_time)))
+                elif datapoints == "Per timestamp":
+                    timestamp = metric.timestamp or payload_timestamp
+                    group = timestamp_readings.get(timestamp)
+                    if group is None:
+                        group = timestamp_readings[timestamp] = {}
+                    group.update(values)
+                else:
+                    device_readings.update(values)
+            if datapoints == 'Per device' and device_readings:
+                readings.append(self.make_reading(asset, topic, device_readings, timestamps.seconds(receive_time)))
+            for timestamp, group in timestamp_readings.items():
+                readings.append(self.make_reading(asset, topic, group, self.reading_timestamp(timestamp,
+                                                                                              receive_time)))
+        except KeyError as err:
+            _LOGGER.error(err, "Check the topic fragments, and ensure that placeholders are replaced with values "
+                               "such as group_id, message_type, edge_node_id, or device_id.")
+        except ValueError as err:
+            _LOGGER.error(err)
+        except Exception as ex:
+            msg = ("Message payload must comply with {} standards. Please ensure that the format and structure "
+                   "of the payload adhere to the specified requirements.".format(NAMESPACE))
+            _LOGGER.error(ex, msg)
+        return readings
+
+    def update_session(self, components, payload, receive_time, readings):
+        """ Apply BIRTH and DEATH certificates to the session state, returns the state of the publishing edge node
+
+        components is the topic split into at most 5 components. A session state reading is appended to readings
+        for each edge node or device going online or offline.
+        """
+        if len(components) < 4:
+            return None
+        message_type = components[2]
+        key = components[1] + '/' + components[3]
+        if message_type == 'NBIRTH' or message_type == 'NDEATH':
+            sequence = bd_seq(payload)
+            if message_type == 'NDEATH':
+                if not self.sessions.death(key, None, sequence, receive_time):
+                    return self.edge_nodes.get(key)
+            else:
+                self.sessions.birth(key, None, sequence, receive_time)
+                if self.snapshot is not None:
+                    self.snapshot.record(key, None, payload)
+            self.session_reading(readings, key, None, message_type, sequence, payload, receive_time)
+            # Values after a rebirth are passed on whatever was passed on before
+            if self.report_filter is not None:
+                self.report_filter.forget(key)
+            if message_type == 'NDEATH':
+                return self.edge_nodes.pop(key, None)
+            # A rebirth replaces everything known about the edge node and its devices
+            edge_node = self.edge_nodes[key] = EdgeNodeState(payload.metrics)
+            return edge_node
+        edge_node = self.edge_nodes.get(key)
+        if edge_node is None and self.snapshot is not None and key not in self.sessions.nodes:
+            # First message of the edge node since the plugin started, its BIRTH may have been received before
+            edge_node = self.restore(key)
+        device_id = components[4] if len(components) == 5 else None
+        if device_id is not None and (message_type == 'DBIRTH' or message_type == 'DDEATH'):
+            if message_type == 'DBIRTH':
+                self.sessions.birth(key, device_id, None, receive_time)
+                if self.snapshot is not None:
+                    self.snapshot.record(key, device_id, payload)
+            elif not self.sessions.death(key, device_id, None, receive_time):
+                return edge_node
+            self.session_reading(readings, key, device_id, message_type, None, payload, receive_time)
+            if self.report_filter is not None:
+                self.report_filter.forget(key, device_id)
+            if message_type == 'DBIRTH':
+                if edge_node is None:
+                    # NBIRTH was published before we subscribed, the device aliases are still usable
+                    edge_node = self.edge_nodes[key] = EdgeNodeState()
+                edge_node.devices[device_id] = AliasTable(payload.metrics)
+            elif edge_node is not None:
+                edge_node.devices.pop(device_id, None)
+        elif message_type == 'NDATA' or message_type == 'DDATA':
+            self.sessions.seen(key, device_id, receive_time)
+        return edge_node
+
+    def restore(self, key):
+        """ Session state of an edge node from the BIRTH certificates snapshot, None if it has none """
+        certificates = self.snapshot.certificates(key)
+        if certificates is None:
+            return None
+        payloads = {}
+        for device_id, certificate in list(certificates.items()):
+            payload = payloads[device_id] = sparkplug_b_pb2.Payload()
+            payload.ParseFromString(bytes(certificate))
+        node_payload = payloads.pop(None, None)
+        edge_node = self.edge_nodes[key] = EdgeNodeState(() if node_payload is None else node_payload.metrics)
+        for device_id, payload in payloads.items():
+            edge_node.devices[device_id] = AliasTable(payload.metrics)
+        sequence = None if node_payload is None else bd_seq(node_payload)
+        self.sessions.restore(key, sequence)
+        _LOGGER.info("Restored the BIRTH certificates of edge node {}.".format(key))
+        return edge_node
+
+    def session_reading(self, readings, node_key, device_id, message_type, sequence, payload, receive_time):
+        """ Append a reading recording an edge node or device going online or offline, if enabled """
+        if not self.session_asset:
+            return
+        values = {'node': node_key, 'state': 'online' if message_type.endswith('BIRTH') else 'offline'}
+        if device_id is not None:
+            values['device'] = device_id
+        if sequence is not None:
+            values['bdSeq'] = sequence
+        timestamp = self.reading_timestamp(payload.timestamp, receive_time)
+        readings.append({'asset': self.session_asset, 'timestamp': timestamp, 'readings': values})
+
+    def reading_timestamp(self, timestamp, receive_time):
+        """ The reading timestamp of a Sparkplug timestamp (milliseconds since epoch), or of the receive time (seconds
+        since epoch) when it is not set """
+        if timestamp:
+            return self.timestamps.milliseconds(timestamp)
+        return self.timestamps.seconds(receive_time)
+
+    def request_rebirth(self, components, receive_time):
+        """ Ask the edge node publishing on the topic components for a rebirth, if enabled """
+        if self.rebirth is not None and len(components) >= 4:
+            self.rebirth.request(components[1], components[3], receive_time)
+
+    def unresolved_alias(self, topic, edge_node, alias):
+        """ Warn once per session about metrics whose alias was not defined by a BIRTH certificate """
+        if edge_node is None:
+            _LOGGER.debug("Ignoring metric alias {} on topic {}; no NBIRTH received.".format(alias, topic))
+            return
+        if not edge_node.unresolved:
+            _LOGGER.warning("Ignoring metric alias {} on topic {}; it is not defined by the BIRTH "
+                            "certificates.".format(alias, topic))
+        edge_node.unresolved += 1
+
+    def template_datapoints(self, edge_node, name, template, last_values, receive_time):
+        """ Datapoints of the members of a template instance named name, None for a template definition """
+        if template.is_definition:
+            return None
+        plan = None
+        if edge_node is not None:
+            plan = edge_node.templates.get(template.template_ref)
+        values = (plan or TemplatePlan.UNDEFINED).flatten(name, template, {})
+        if last_values is not None:
+            report = self.report_filter.report
+            values = {member: value for member, value in values.items()
+                      if report(last_values, member, value, receive_time)}
+        return values
+
+    def dataset_readings(self, asset, topic, metric, payload_timestamp, receive_time):
+        """ A reading per row of a DataSet metric, timestamped by the metric, else by its payload, else when received
+        """
+        names, columns = dataset_columns(metric.dataset_value)
+        columns = [map(bool, column) if column_type == 11 else column
+                   for column, column_type in zip(columns, metric.dataset_value.types)]
+        timestamp = self.reading_timestamp(metric.timestamp or payload_timestamp, receive_time)
+        return [self.make_reading(asset, topic, dict(zip(names, row)), timestamp) for row in zip(*columns)]
+
+    def make_reading(self, asset, topic, readings, ts):
+        if self.attach_topic_datapoint == "true":
+            readings.update({"SparkPlugB:Topic": topic})
+        data = {
+            'asset': asset,
+            'timestamp': ts,
+            'readings': readings
+        }
+        return data
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# FLEDGE_BEGIN
+# See: http://fledge-iot.readthedocs.io/
+# FLEDGE_END
+
+""" Benchmark of the memory allocated to parse a Sparkplug message
+
+Compares a Payload allocated for each message, which the plugin used before, with the Payload of the decoder parsed
+into again for each message, measuring with tracemalloc the bytes allocated per message, and the time per message.
+
+Run from the repository root: python3 -m tests.benchmarks.allocation
+"""
+
+import timeit
+import tracemalloc
+
+from google.protobuf.internal import api_implementation
+
+from python.fledge.plugins.south.mqtt_sparkplug import mqtt_sparkplug
+from python.fledge.plugins.south.mqtt_sparkplug.sparkplug_b import sparkplug_b_pb2
+
+__author__ = "Fledge contributors"
+__copyright__ = "Copyright (c) 2024 Dianomic Systems, Inc."
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+MESSAGES = 1000
+NUMBER = 5000
+METRICS = 50
+TOPIC = "spBv1.0/Plant/DDATA/Line1/Press"
+
+
+def make_message():
+    """ A DDATA message of METRICS metrics of mixed datatypes, with timestamps """
+    payload = sparkplug_b_pb2.Payload(timestamp=1729752898000, seq=0)
+    for index in range(METRICS):
+        metric = payload.metrics.add()
+        metric.name = "Metric{}".format(index)
+        metric.timestamp = 1729752898000 + index
+        kind = index % 4
+        if kind == 0:
+            metric.datatype = 10
+            metric.double_value = index / 10
+        elif kind == 1:
+            metric.datatype = 3
+            metric.int_value = index
+        elif kind == 2:
+            metric.datatype = 11
+            metric.boolean_value = bool(index % 2)
+        else:
+            metric.datatype = 12
+            metric.string_value = "state {}".format(index)
+    return payload.SerializeToString()
+
+
+def fresh(message, _payload):
+    sparkplug_b_pb2.Payload().ParseFromString(message)
+
+
+def reused(message, payload):
+    payload.ParseFromString(message)
+
+
+def allocated(parse, message, payload):
+    """ Average bytes allocated while parsing a message, as the peak traced memory above what was traced before
+
+    payload is cleared before each message, so that the memory it frees does not offset what parsing allocates.
+    """
+    parse(message, payload)
+    total = 0
+    tracemalloc.start()
+    for _ in range(MESSAGES):
+        payload.Clear()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        parse(message, payload)
+        total += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return total / MESSAGES
+
+
+def elapsed(parse, message):
+    """ Microseconds to parse a message, without tracemalloc """
+    payload = sparkplug_b_pb2.Payload()
+    return min(timeit.repeat(lambda: parse(message, payload), number=NUMBER, repeat=3)) / NUMBER * 1e6
+
+
+def main():
+    # Decoded as the plugin does, with the Payload module the benchmark imports
+    mqtt_sparkplug.sparkplug_b_pb2 = sparkplug_b_pb2
+    message = make_message()
+    decoder = mqtt_sparkplug.SparkplugDecoder(
+        {key: dict(item, value=item['default']) for key, item in mqtt_sparkplug._DEFAULT_CONFIG.items()})
+
+    def decode(data, _payload):
+        decoder.decode(TOPIC, data, 0)
+
+    print("protobuf {} backend".format(api_implementation.Type()))
+    print("{:<14} {:>14} {:>12}".format("Payload", "bytes/message", "us/message"))
+    for name, parse, payload in [("before", fresh, sparkplug_b_pb2.Payload()),
+                                 ("after", reused, sparkplug_b_pb2.Payload()),
+                                 ("after, decode", decode, decoder.payload or sparkplug_b_pb2.Payload())]:
+        print("{:<14} {:>14.0f} {:>12.1f}".format(name, allocated(parse, message, payload), elapsed(parse, message)))
+
+
+if __name__ == '__main__':
+    main()
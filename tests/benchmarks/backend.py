@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# FLEDGE_BEGIN
+# See: http://fledge-iot.readthedocs.io/
+# FLEDGE_END
+
+""" Benchmark of the protobuf backends on a corpus of Sparkplug B payloads
+
+The protobuf implementation is chosen once per interpreter, so each backend is measured in a process of its own,
+started with PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION set to it. For each payload of the corpus, the time to parse it
+and the time for the plugin to decode it into readings are compared with those of the pure-Python backend. A backend
+that is not installed, or cannot load the generated sparkplug_b_pb2 module, is reported as unavailable; the
+protobuf package may also fall back to another backend than the one asked for, the backend used is shown.
+
+Run from the repository root: python3 -m tests.benchmarks.backend
+"""
+
+import json
+import os
+import struct
+import subprocess
+import sys
+import timeit
+
+__author__ = "Fledge contributors"
+__copyright__ = "Copyright (c) 2024 Dianomic Systems, Inc."
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+BACKENDS = ["python", "cpp", "upb"]
+GROUP_TOPIC = "spBv1.0/Plant/{}/Line1"
+DEVICE_TOPIC = GROUP_TOPIC + "/Press"
+
+
+def make_corpus(sparkplug_b_pb2):
+    """ (name, topic, serialized payload) of the corpus, the NBIRTH first as it defines the aliases """
+    corpus = []
+
+    birth = sparkplug_b_pb2.Payload(timestamp=1729752898000, seq=0)
+    metric = birth.metrics.add(name="bdSeq", datatype=8)
+    metric.long_value = 0
+    for index in range(200):
+        metric = birth.metrics.add(name="Line/Metric{}".format(index), alias=index, datatype=10)
+        metric.double_value = 0.0
+    corpus.append(("NBIRTH 200 metrics", GROUP_TOPIC.format("NBIRTH"), birth))
+
+    data = sparkplug_b_pb2.Payload(timestamp=1729752898000, seq=1)
+    for index in range(10):
+        metric = data.metrics.add(alias=index, timestamp=1729752898000)
+        metric.double_value = index / 10
+    corpus.append(("NDATA 10 aliases", GROUP_TOPIC.format("NDATA"), data))
+
+    data = sparkplug_b_pb2.Payload(timestamp=1729752898000, seq=2)
+    for index in range(50):
+        metric = data.metrics.add(name="Metric{}".format(index), timestamp=1729752898000 + index)
+        kind = index % 4
+        if kind == 0:
+            metric.datatype = 10
+            metric.double_value = index / 10
+        elif kind == 1:
+            metric.datatype = 3
+            metric.int_value = index
+        elif kind == 2:
+            metric.datatype = 11
+            metric.boolean_value = bool(index % 2)
+        else:
+            metric.datatype = 12
+            metric.string_value = "state {}".format(index)
+    corpus.append(("DDATA 50 metrics", DEVICE_TOPIC.format("DDATA"), data))
+
+    data = sparkplug_b_pb2.Payload(timestamp=1729752898000, seq=3)
+    metric = data.metrics.add(name="Waveform", datatype=31, timestamp=1729752898000)
+    metric.bytes_value = struct.pack("<1000d", *(index / 100 for index in range(1000)))
+    corpus.append(("DDATA 1k array", DEVICE_TOPIC.format("DDATA"), data))
+
+    data = sparkplug_b_pb2.Payload(timestamp=1729752898000, seq=4)
+    metric = data.metrics.add(name="History", datatype=16, timestamp=1729752898000)
+    dataset = metric.dataset_value
+    dataset.num_of_columns = 3
+    dataset.columns.extend(["Sample", "Value", "Valid"])
+    dataset.types.extend([7, 10, 11])
+    for index in range(1000):
+        row = dataset.rows.add()
+        row.elements.add().int_value = index
+        row.elements.add().double_value = index / 10
+        row.elements.add().boolean_value = bool(index % 2)
+    corpus.append(("DDATA 1k DataSet", DEVICE_TOPIC.format("DDATA"), data))
+
+    data = sparkplug_b_pb2.Payload(timestamp=1729752898000, seq=5)
+    metric = data.metrics.add(name="Motor", datatype=19, timestamp=1729752898000)
+    template = metric.template_value
+    template.template_ref = "Motor"
+    for index in range(20):
+        member = template.metrics.add(name="Member{}".format(index), datatype=10)
+        member.double_value = index / 10
+    corpus.append(("DDATA template", DEVICE_TOPIC.format("DDATA"), data))
+
+    return [(name, topic, payload.SerializeToString()) for name, topic, payload in corpus]
+
+
+def timed(function):
+    """ Microseconds per call of function, the best of 3 repeats of at least 0.2 seconds """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(number=number, repeat=3)) / number * 1e6
+
+
+def measure():
+    """ Print as JSON the backend of this process and the parse and decode times of each payload of the corpus """
+    from google.protobuf.internal import api_implementation
+    from python.fledge.plugins.south.mqtt_sparkplug import mqtt_sparkplug
+    from python.fledge.plugins.south.mqtt_sparkplug.sparkplug_b import sparkplug_b_pb2
+
+    # Decoded as the plugin does, with the Payload module the benchmark imports
+    mqtt_sparkplug.sparkplug_b_pb2 = sparkplug_b_pb2
+    decoder = mqtt_sparkplug.SparkplugDecoder(
+        {key: dict(item, value=item['default']) for key, item in mqtt_sparkplug._DEFAULT_CONFIG.items()})
+    results = []
+    for name, topic, message in make_corpus(sparkplug_b_pb2):
+        decoder.decode(topic, message, 0)
+        parse = timed(lambda: sparkplug_b_pb2.Payload().ParseFromString(message))
+        decode = timed(lambda: decoder.decode(topic, message, 0))
+        results.append((name, parse, decode))
+    print(json.dumps({'backend': api_implementation.Type(), 'results': results}))
+
+
+def run(backend):
+    """ Results of measure in a process using backend, or the reason it is unavailable """
+    env = dict(os.environ, PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=backend)
+    process = subprocess.run([sys.executable, "-m", "tests.benchmarks.backend", "--measure"], env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        # The exception raised, rather than the explanation some protobuf errors follow it with
+        lines = [line for line in process.stderr.splitlines() if "Error: " in line] or process.stderr.splitlines()
+        return "unavailable: " + (lines[-1] if lines else "exit status {}".format(process.returncode))
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main():
+    measured = {}
+    for backend in BACKENDS:
+        result = run(backend)
+        if isinstance(result, str):
+            print("{:<7} {}".format(backend, result))
+            continue
+        if result['backend'] != backend:
+            print("{:<7} unavailable: the {} backend is used instead".format(backend, result['backend']))
+            continue
+        measured[backend] = result['results']
+    baseline = measured.get("python")
+    print("{:<7} {:<20} {:>12} {:>12} {:>9} {:>9}".format("Backend", "Payload", "parse (us)", "decode (us)",
+                                                          "parse x", "decode x"))
+    for backend, results in measured.items():
+        for index, (name, parse, decode) in enumerate(results):
+            speedups = ("", "")
+            if baseline is not None:
+                speedups = ("{:.1f}".format(baseline[index][1] / parse), "{:.1f}".format(baseline[index][2] / decode))
+            print("{:<7} {:<20} {:>12.1f} {:>12.1f} {:>9} {:>9}".format(backend, name, parse, decode, *speedups))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ["--measure"]:
+        measure()
+    else:
+        main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# FLEDGE_BEGIN
+# See: http://fledge-iot.readthedocs.io/
+# FLEDGE_END
+
+""" Microbenchmark of the per metric cost of extracting a Sparkplug metric value
+
+Compares the HasField if/elif chain with ctypes sign handling, which the plugin used before, with the WhichOneof
+dispatch table for each supported Sparkplug datatype.
+
+Run from the repository root: python3 -m tests.benchmarks.metric_value
+"""
+
+import ctypes
+import timeit
+
+from python.fledge.plugins.south.mqtt_sparkplug import mqtt_sparkplug
+from python.fledge.plugins.south.mqtt_sparkplug.sparkplug_b import sparkplug_b_pb2
+
+__author__ = "Fledge contributors"
+__copyright__ = "Copyright (c) 2024 Dianomic Systems, Inc."
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+NUMBER = 200000
+
+# Datatype name, Sparkplug datatype, value field, value as published
+SAMPLES = [
+    ("Int8", 1, "int_value", 0xFFFFFF85),
+    ("Int16", 2, "int_value", 0xFFFF8001),
+    ("Int32", 3, "int_value", 0x80000001),
+    ("Int64", 4, "long_value", 0x8000000000000001),
+    ("UInt8", 5, "int_value", 200),
+    ("UInt16", 6, "int_value", 60000),
+    ("UInt32", 7, "int_value", 4000000000),
+    ("UInt64", 8, "long_value", 18000000000000000000),
+    ("Float", 9, "float_value", 1.5),
+    ("Double", 10, "double_value", 2.25),
+    ("Boolean", 11, "boolean_value", True),
+    ("String", 12, "string_value", "running"),
+    ("DateTime", 13, "long_value", 1729752898000)
+]
+
+
+def legacy_value(metric):
+    """ Value extraction as it was done in on_message before the dispatch table """
+    value = "Unknown"
+    if metric.HasField("boolean_value"):
+        value = metric.boolean_value
+    elif metric.HasField("float_value"):
+        value = metric.float_value
+    elif metric.HasField("double_value"):
+        value = metric.double_value
+    elif metric.HasField("int_value"):
+        data_type = metric.datatype if metric.HasField("datatype") else 3
+        if data_type < 4:
+            value = ctypes.c_int(metric.int_value).value
+        else:
+            value = metric.int_value
+    elif metric.HasField("long_value"):
+        data_type = metric.datatype if metric.HasField("datatype") else 4
+        if data_type == 4:
+            value = ctypes.c_long(metric.long_value).value
+        else:
+            value = metric.long_value
+    elif metric.HasField("string_value"):
+        value = metric.string_value
+    return value
+
+
+def current_value(metric):
+    """ Value extraction as done by SparkplugDecoder.decode """
+    converter = mqtt_sparkplug._VALUE_CONVERTERS.get(metric.WhichOneof("value"))
+    return converter(metric, metric.datatype)
+
+
+def main():
+    payload = sparkplug_b_pb2.Payload()
+    print("{:<10} {:>12} {:>12} {:>8}".format("Datatype", "before (ns)", "after (ns)", "speedup"))
+    for name, datatype, field, published in SAMPLES:
+        metric = payload.metrics.add()
+        metric.name = name
+        metric.datatype = datatype
+        setattr(metric, field, published)
+        before = min(timeit.repeat(lambda: legacy_value(metric), number=NUMBER, repeat=3)) / NUMBER * 1e9
+        after = min(timeit.repeat(lambda: current_value(metric), number=NUMBER, repeat=3)) / NUMBER * 1e9
+        print("{:<10} {:>12.1f} {:>12.1f} {:>7.2f}x".format(name, before, after, before / after))
+
+
+if __name__ == '__main__':
+    main()
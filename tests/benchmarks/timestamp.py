@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# FLEDGE_BEGIN
+# See: http://fledge-iot.readthedocs.io/
+# FLEDGE_END
+
+""" Benchmark of the reading timestamp conversion of Sparkplug metric timestamps
+
+Compares the datetime.fromtimestamp(...).strftime(...) conversion, which the plugin used before, with the
+TimestampFormatter for a payload whose metrics share the same second and for metrics of distinct seconds.
+
+Run from the repository root: python3 -m tests.benchmarks.timestamp
+"""
+
+import timeit
+from datetime import datetime, timezone
+
+from python.fledge.plugins.south.mqtt_sparkplug import mqtt_sparkplug
+
+__author__ = "Fledge contributors"
+__copyright__ = "Copyright (c) 2024 Dianomic Systems, Inc."
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+NUMBER = 200
+METRICS = 500
+START = 1729752898000
+
+
+def legacy(timestamps):
+    # The previous conversion took the milliseconds as seconds, so give it seconds to keep it within range
+    return [datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')
+            for timestamp in timestamps]
+
+
+def current(timestamps):
+    milliseconds = mqtt_sparkplug.TimestampFormatter().milliseconds
+    return [milliseconds(timestamp) for timestamp in timestamps]
+
+
+def main():
+    corpus = {
+        "same second": [START + index % 1000 for index in range(METRICS)],
+        "distinct seconds": [START + index * 1000 for index in range(METRICS)]
+    }
+    print("{:<18} {:>12} {:>12} {:>8}".format("Payload", "before (ns)", "after (ns)", "speedup"))
+    for name, timestamps in corpus.items():
+        before = min(timeit.repeat(lambda: legacy(timestamps), number=NUMBER, repeat=3)) / NUMBER / METRICS * 1e9
+        after = min(timeit.repeat(lambda: current(timestamps), number=NUMBER, repeat=3)) / NUMBER / METRICS * 1e9
+        print("{:<18} {:>12.1f} {:>12.1f} {:>7.2f}x".format(name, before, after, before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -35,7 +35,7 @@ def create_dbirth_payload():
             {
                 "name": "Temperature Sensor",
                 "value": random.uniform(22.0, 32.0),  # Float
-                "timestamp": int(time.time()),
+                "timestamp": int(time.time() * 1000),
                 "type": "float"
             }
         ]
@@ -59,31 +59,31 @@ def create_ddata_payload():
             {
                 "name": "Temperature Sensor",
                 "value": random.uniform(22.0, 32.0),  # Float
-                "timestamp": int(time.time()),
+                "timestamp": int(time.time() * 1000),
                 "type": "float"
             },
             {
                 "name": "Double",
                 "value": random.uniform(-100.0, 100.0),  # Double
-                "timestamp": int(time.time()),
+                "timestamp": int(time.time() * 1000),
                 "type": "double"
             },
             {
                 "name": "Humidity Sensor",
                 "value": random.randint(45, 175),  # Integer
-                "timestamp": int(time.time()),
+                "timestamp": int(time.time() * 1000),
                 "type": "integer"
             },
             {
                 "name": "Location",
                 "value": "NCR",  # String
-                "timestamp": int(time.time()),
+                "timestamp": int(time.time() * 1000),
                 "type": "string"
             },
             {
                 "name": "Status",
                 "value": random.choice(bool_values),  # Boolean
-                "timestamp": int(time.time()),
+                "timestamp": int(time.time() * 1000),
                 "type": "boolean"
             }
         ]
@@ -133,7 +133,7 @@ def create_ddeath_payload():
             {
                 "name": "Status",
                 "value": False,  # Boolean
-                "timestamp": int(time.time()),
+                "timestamp": int(time.time() * 1000),
                 "type": "boolean"
             }
         ]
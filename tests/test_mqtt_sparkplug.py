@@ -4,10 +4,15 @@
 # See: http://fledge-iot.readthedocs.io/
 # FLEDGE_END
 
-from unittest.mock import patch
+import asyncio
+import json
+import threading
+import time
+from unittest.mock import MagicMock, patch
 import pytest
 
 from python.fledge.plugins.south.mqtt_sparkplug import mqtt_sparkplug
+from python.fledge.plugins.south.mqtt_sparkplug.sparkplug_b import sparkplug_b_pb2
 
 __author__ = "Ashish Jabble"
 __copyright__ = "Copyright (c) 2019 Dianomic Systems"
@@ -16,6 +21,21 @@ __version__ = "${VERSION}"
 
 config = mqtt_sparkplug._DEFAULT_CONFIG
 plugin_name = mqtt_sparkplug._PLUGIN_NAME
+DDATA_TOPIC = "spBv1.0/Opto22/DDATA/groovEPIC_workshop/Strategy"
+
+
+def plugin_config(**values):
+    """ Configuration category as passed to plugin_init, with default values unless overridden """
+    category = {key: dict(item, value=item['default']) for key, item in config.items() if key != '_mqtt'}
+    for key, value in values.items():
+        category[key]['value'] = value
+    return category
+
+
+@pytest.fixture
+def pb2():
+    with patch.object(mqtt_sparkplug, 'sparkplug_b_pb2', sparkplug_b_pb2, create=True):
+        yield sparkplug_b_pb2
 
 
 def test_plugin_contract():
@@ -39,9 +59,23 @@ def test_plugin_info():
 
 
 def test_plugin_init():
+    category = plugin_config()
     with patch.object(mqtt_sparkplug, 'MqttSubscriberClient', return_value=None):
-        config['_mqtt'] = None
-        assert mqtt_sparkplug.plugin_init(config) == config
+        assert mqtt_sparkplug.plugin_init(category) == dict(category, _mqtt=None)
+
+
+@pytest.mark.parametrize("requirement", ['Any', 'Warn If Python', 'Require Native'])
+@pytest.mark.parametrize("backend", ['python', 'cpp', 'upb'])
+def test_plugin_init_protobuf_backend(requirement, backend):
+    with patch.object(mqtt_sparkplug, 'MqttSubscriberClient', return_value=None), \
+            patch.object(mqtt_sparkplug.api_implementation, 'Type', return_value=backend), \
+            patch.object(mqtt_sparkplug._LOGGER, 'warning') as warning:
+        if backend == 'python' and requirement == 'Require Native':
+            with pytest.raises(RuntimeError):
+                mqtt_sparkplug.plugin_init(plugin_config(protobufBackend=requirement))
+        else:
+            mqtt_sparkplug.plugin_init(plugin_config(protobufBackend=requirement))
+    assert warning.called == (backend == 'python' and requirement == 'Warn If Python')
 
 
 @pytest.mark.skip(reason="To be implemented")
@@ -49,11 +83,1009 @@ def test_plugin_start():
     pass
 
 
-@pytest.mark.skip(reason="To be implemented")
-def test_plugin_reconfigure():
-    pass
+def test_plugin_reconfigure_keeps_connection():
+    client = MagicMock()
+    handle = dict(plugin_config(), _mqtt=client)
+    with patch.object(mqtt_sparkplug, 'plugin_shutdown') as shutdown:
+        new_handle = mqtt_sparkplug.plugin_reconfigure(handle, plugin_config(assetName='other'))
+    shutdown.assert_not_called()
+    assert new_handle['_mqtt'] is client and new_handle['assetName']['value'] == 'other'
+    client.reconfigure.assert_called_once_with(new_handle)
+
+
+def test_plugin_reconfigure_reconnects():
+    handle = dict(plugin_config(), _mqtt=MagicMock())
+    with patch.object(mqtt_sparkplug, 'plugin_shutdown') as shutdown, \
+            patch.object(mqtt_sparkplug, 'plugin_init', return_value={}) as init, \
+            patch.object(mqtt_sparkplug, 'plugin_start'):
+        mqtt_sparkplug.plugin_reconfigure(handle, plugin_config(url='broker'))
+    shutdown.assert_called_once_with(handle)
+    init.assert_called_once()
 
 
 @pytest.mark.skip(reason="To be implemented")
 def test_plugin_shutdown():
     pass
+
+
+class TestReadingsBatcher:
+
+    def test_flush_on_size(self):
+        batches = []
+        batcher = mqtt_sparkplug.ReadingsBatcher(batches.append, 3, 60)
+        for i in range(7):
+            batcher.add({'asset': 'mqtt', 'readings': {'i': i}})
+        assert [len(b) for b in batches] == [3, 3]
+        batcher.flush()
+        assert [len(b) for b in batches] == [3, 3, 1]
+
+    def test_flush_on_timeout(self):
+        batches = []
+        batcher = mqtt_sparkplug.ReadingsBatcher(batches.append, 100, 0.05)
+        batcher.start()
+        try:
+            batcher.add({'asset': 'mqtt', 'readings': {'i': 1}})
+            time.sleep(0.3)
+            assert batches == [[{'asset': 'mqtt', 'readings': {'i': 1}}]]
+        finally:
+            batcher.stop()
+
+    def test_stop_flushes_pending(self):
+        batches = []
+        batcher = mqtt_sparkplug.ReadingsBatcher(batches.append, 100, 60)
+        batcher.start()
+        batcher.add({'asset': 'mqtt', 'readings': {'i': 1}})
+        batcher.stop()
+        assert len(batches) == 1
+
+
+class TestWorkQueue:
+
+    def test_drop_newest(self):
+        queue = mqtt_sparkplug.WorkQueue(2, 'Drop newest')
+        assert queue.put(1) and queue.put(2)
+        assert queue.put(3) is False
+        assert [queue.get(), queue.get()] == [1, 2]
+        assert queue.dropped == 1
+
+    def test_drop_oldest(self):
+        queue = mqtt_sparkplug.WorkQueue(2, 'Drop oldest')
+        queue.put(1)
+        queue.put(2)
+        assert queue.put(3) is False
+        assert [queue.get(), queue.get()] == [2, 3]
+        assert queue.dropped == 1
+
+    def test_close_drains_then_stops(self):
+        queue = mqtt_sparkplug.WorkQueue(2)
+        queue.put(1)
+        queue.close()
+        assert queue.get() == 1
+        assert queue.get() is None
+
+    def test_get_times_out(self):
+        queue = mqtt_sparkplug.WorkQueue(2)
+        assert queue.get(0.01) is mqtt_sparkplug.WorkQueue.EMPTY
+
+
+def test_partition_index_is_per_edge_node():
+    count = 8
+    index = mqtt_sparkplug.partition_index(DDATA_TOPIC, count)
+    assert mqtt_sparkplug.partition_index("spBv1.0/Opto22/NDATA/groovEPIC_workshop", count) == index
+    assert mqtt_sparkplug.partition_index("spBv1.0/Opto22/DBIRTH/groovEPIC_workshop/Other", count) == index
+
+
+class TestSparkplugDecoder:
+
+    def test_decode_per_device(self, pb2):
+        payload = pb2.Payload()
+        metric = payload.metrics.add()
+        metric.name = "Temperature"
+        metric.double_value = 21.5
+        metric = payload.metrics.add()
+        metric.name = "Status"
+        metric.boolean_value = True
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(datapoints='Per device'))
+        readings = decoder.decode(DDATA_TOPIC, payload.SerializeToString(), 0)
+        assert readings == [{'asset': 'mqtt', 'timestamp': '1970-01-01 00:00:00.000000+00:00',
+                             'readings': {'Temperature': 21.5, 'Status': True}}]
+
+    def test_decode_resolves_aliases(self, pb2):
+        birth = pb2.Payload()
+        for alias, name in enumerate(["Temperature", "Pressure"]):
+            metric = birth.metrics.add()
+            metric.name = name
+            metric.alias = alias
+            metric.datatype = 10
+            metric.double_value = 0.0
+        data = pb2.Payload()
+        metric = data.metrics.add()
+        metric.alias = 1
+        metric.double_value = 2.5
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(datapoints='Per device'))
+        decoder.decode("spBv1.0/Opto22/DBIRTH/groovEPIC_workshop/Strategy", birth.SerializeToString(), 0)
+        readings = decoder.decode(DDATA_TOPIC, data.SerializeToString(), 0)
+        assert readings[0]['readings'] == {'Pressure': 2.5}
+        decoder.decode("spBv1.0/Opto22/DDEATH/groovEPIC_workshop/Strategy", b'', 0)
+        assert decoder.decode(DDATA_TOPIC, data.SerializeToString(), 0) == []
+
+    def test_decode_skips_metric_without_name_or_alias(self, pb2):
+        birth = pb2.Payload()
+        birth.metrics.add(name="Temperature", alias=0, datatype=10, double_value=0.0)
+        data = pb2.Payload()
+        data.metrics.add(double_value=9.9)
+        data.metrics.add(alias=0, double_value=1.5)
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(datapoints='Per metric'))
+        decoder.decode("spBv1.0/Opto22/NBIRTH/groovEPIC_workshop", birth.SerializeToString(), 0)
+        readings = decoder.decode(DDATA_TOPIC, data.SerializeToString(), 0)
+        assert [reading['readings'] for reading in readings] == [{'Temperature': 1.5}]
+
+    def test_decode_named_metric_datatype_from_birth(self, pb2):
+        birth = pb2.Payload()
+        birth.metrics.add(name="Vib", datatype=23, bytes_value=b'')
+        birth.metrics.add(name="Count", datatype=7, int_value=0)
+        data = pb2.Payload()
+        data.metrics.add(name="Vib", bytes_value=(1).to_bytes(2, 'little') + (-2).to_bytes(2, 'little', signed=True))
+        data.metrics.add(name="Count", int_value=4000000000)
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(datapoints='Per device'))
+        decoder.decode("spBv1.0/Opto22/NBIRTH/groovEPIC_workshop", birth.SerializeToString(), 0)
+        readings = decoder.decode(DDATA_TOPIC, data.SerializeToString(), 0)
+        assert readings[0]['readings'] == {'Vib': [1, -2], 'Count': 4000000000}
+
+    def test_decode_per_timestamp(self, pb2):
+        payload = pb2.Payload()
+        payload.timestamp = 300
+        for name, timestamp in [("a", 100), ("b", 200), ("c", 100), ("d", 0)]:
+            metric = payload.metrics.add()
+            metric.name = name
+            metric.timestamp = timestamp
+            metric.int_value = 1
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(datapoints='Per timestamp'))
+        readings = decoder.decode(DDATA_TOPIC, payload.SerializeToString(), 0)
+        assert [reading['readings'] for reading in readings] == [{"a": 1, "c": 1}, {"b": 1}, {"d": 1}]
+        assert [reading['timestamp'] for reading in readings] == [
+            "1970-01-01 00:00:00.{}000+00:00".format(timestamp) for timestamp in (100, 200, 300)]
+
+    @pytest.mark.parametrize("settings, expected", [
+        ({'datapoints': 'Per metric'}, [300, 300, 200]),
+        ({'datapoints': 'Per metric', 'dataSets': 'Rows'}, [300, 300, 300, 300, 200])
+    ])
+    def test_decode_metric_without_timestamp(self, pb2, settings, expected):
+        payload = pb2.Payload()
+        payload.timestamp = 300
+        metric = payload.metrics.add()
+        metric.name = "Table"
+        make_dataset(pb2, metric)
+        payload.metrics.add(name="a", int_value=1)
+        payload.metrics.add(name="b", int_value=1, timestamp=200)
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(**settings))
+        readings = decoder.decode(DDATA_TOPIC, payload.SerializeToString(), 0)
+        # Metrics without a timestamp of their own take that of the payload
+        assert [reading['timestamp'] for reading in readings] == [
+            "1970-01-01 00:00:00.{}000+00:00".format(timestamp) for timestamp in expected]
+
+    @pytest.mark.parametrize("settings, expected", [
+        ({'datapoints': 'Per metric'}, ["00.400000", "00.400000", "00.200000"]),
+        ({'datapoints': 'Per metric', 'dataSets': 'Rows'}, ["00.400000"] * 4 + ["00.200000"]),
+        ({'datapoints': 'Per timestamp'}, ["00.400000", "00.200000"])
+    ])
+    def test_decode_payload_without_timestamp(self, pb2, settings, expected):
+        payload = pb2.Payload()
+        metric = payload.metrics.add()
+        metric.name = "Table"
+        make_dataset(pb2, metric)
+        payload.metrics.add(name="a", int_value=1)
+        payload.metrics.add(name="b", int_value=1, timestamp=200)
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(**settings))
+        readings = decoder.decode(DDATA_TOPIC, payload.SerializeToString(), 0.4)
+        # Neither the metric nor the payload has a timestamp, the reading is timestamped when received
+        assert [reading['timestamp'] for reading in readings] == [
+            "1970-01-01 00:00:{}+00:00".format(timestamp) for timestamp in expected]
+
+
+def make_dataset(pb2, metric):
+    dataset = metric.dataset_value
+    dataset.num_of_columns = 3
+    dataset.columns.extend(["Int8", "Double", "Name"])
+    dataset.types.extend([1, 10, 12])
+    for int8, double, name in [(0xFFFFFFFF, 1.5, "a"), (0x7F, 2.5, "b"), (0x80, 3.5, "c")]:
+        row = dataset.rows.add()
+        row.elements.add().int_value = int8
+        row.elements.add().double_value = double
+        row.elements.add().string_value = name
+    return dataset
+
+
+class TestDataSet:
+
+    def test_dataset_columns(self, pb2):
+        names, columns = mqtt_sparkplug.dataset_columns(make_dataset(pb2, pb2.Payload.Metric()))
+        assert names == ["Int8", "Double", "Name"]
+        assert columns[0].typecode == 'b' and columns[0].tolist() == [-1, 127, -128]
+        assert columns[1].typecode == 'd' and columns[1].tolist() == [1.5, 2.5, 3.5]
+        assert columns[2] == ["a", "b", "c"]
+
+    @pytest.mark.parametrize("values, unsigned, signed, expected", [
+        ([0xFFFFFFFE, 0xFE, 2], 'I', 'b', [-2, -2, 2]),
+        ([0xFFFF8000, 0x8000, 2], 'I', 'h', [-32768, -32768, 2]),
+        ([0x80000000, 2], 'I', 'i', [-2147483648, 2]),
+        ([0xFFFFFFFFFFFFFFFF, 2], 'Q', 'q', [-1, 2])
+    ])
+    def test_to_signed_array(self, values, unsigned, signed, expected):
+        assert mqtt_sparkplug.to_signed_array(values, unsigned, signed).tolist() == expected
+
+    @pytest.mark.parametrize("mode, expected", [
+        ('Columns', [{"Table": {"Int8": [-1, 127, -128], "Double": [1.5, 2.5, 3.5], "Name": '["a", "b", "c"]'}}]),
+        ('Rows', [{"Int8": -1, "Double": 1.5, "Name": "a"}, {"Int8": 127, "Double": 2.5, "Name": "b"},
+                  {"Int8": -128, "Double": 3.5, "Name": "c"}])
+    ])
+    def test_decode(self, pb2, mode, expected):
+        payload = pb2.Payload()
+        metric = payload.metrics.add()
+        metric.name = "Table"
+        metric.datatype = 16
+        make_dataset(pb2, metric)
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(dataSets=mode))
+        readings = decoder.decode(DDATA_TOPIC, payload.SerializeToString(), 0)
+        assert [reading['readings'] for reading in readings] == expected
+
+    @pytest.mark.parametrize("mode, expected", [
+        ('Columns', [{"Table": {"On": [True, False]}}]),
+        ('Rows', [{"On": True}, {"On": False}])
+    ])
+    def test_decode_boolean_column(self, pb2, mode, expected):
+        payload = pb2.Payload()
+        dataset = payload.metrics.add(name="Table", datatype=16).dataset_value
+        dataset.num_of_columns = 1
+        dataset.columns.append("On")
+        dataset.types.append(11)
+        for value in (True, False):
+            dataset.rows.add().elements.add().boolean_value = value
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(dataSets=mode))
+        readings = decoder.decode(DDATA_TOPIC, payload.SerializeToString(), 0)
+        values = [reading['readings'] for reading in readings]
+        assert values == expected
+        # Equal to 1 and 0 as well, so check that they are bool
+        booleans = values[0]["Table"]["On"] if mode == 'Columns' else [reading["On"] for reading in values]
+        assert all(type(value) is bool for value in booleans)
+
+
+class TestTemplates:
+    NBIRTH_TOPIC = "spBv1.0/Opto22/NBIRTH/groovEPIC_workshop"
+    NDATA_TOPIC = "spBv1.0/Opto22/NDATA/groovEPIC_workshop"
+
+    @staticmethod
+    def nbirth(pb2, speed_datatype):
+        payload = pb2.Payload()
+        bearing = payload.metrics.add()
+        bearing.name = "Bearing"
+        bearing.datatype = 19
+        bearing.template_value.is_definition = True
+        member = bearing.template_value.metrics.add()
+        member.name = "Temperature"
+        member.datatype = 10
+        motor = payload.metrics.add()
+        motor.name = "Motor"
+        motor.datatype = 19
+        motor.template_value.is_definition = True
+        member = motor.template_value.metrics.add()
+        member.name = "Speed"
+        member.datatype = speed_datatype
+        member = motor.template_value.metrics.add()
+        member.name = "Front"
+        member.datatype = 19
+        member.template_value.template_ref = "Bearing"
+        return payload.SerializeToString()
+
+    @staticmethod
+    def ndata(pb2):
+        payload = pb2.Payload()
+        motor = payload.metrics.add()
+        motor.name = "Motor1"
+        motor.datatype = 19
+        motor.template_value.template_ref = "Motor"
+        member = motor.template_value.metrics.add()
+        member.name = "Speed"
+        member.int_value = 0xFFFFFFFF
+        member = motor.template_value.metrics.add()
+        member.name = "Front"
+        member.template_value.template_ref = "Bearing"
+        member = member.template_value.metrics.add()
+        member.name = "Temperature"
+        member.double_value = 40.5
+        return payload.SerializeToString()
+
+    def test_instances_are_flattened(self, pb2):
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(datapoints='Per device'))
+        assert decoder.decode(self.NBIRTH_TOPIC, self.nbirth(pb2, 7), 0) == []
+        readings = decoder.decode(self.NDATA_TOPIC, self.ndata(pb2), 0)
+        assert readings[0]['readings'] == {"Motor1/Speed": 0xFFFFFFFF, "Motor1/Front/Temperature": 40.5}
+        # A rebirth replaces the definitions
+        decoder.decode(self.NBIRTH_TOPIC, self.nbirth(pb2, 3), 0)
+        readings = decoder.decode(self.NDATA_TOPIC, self.ndata(pb2), 0)
+        assert readings[0]['readings'] == {"Motor1/Speed": -1, "Motor1/Front/Temperature": 40.5}
+
+    def test_compile(self, pb2):
+        payload = pb2.Payload()
+        payload.ParseFromString(self.nbirth(pb2, 7))
+        plans = mqtt_sparkplug.TemplatePlan.compile(payload.metrics)
+        assert plans["Motor"].members["Speed"] == ("/Speed", 7, None)
+        assert plans["Motor"].members["Front"][2] is plans["Bearing"]
+
+
+@pytest.mark.parametrize("datatype, data, expected", [
+    (22, b'\xff\x01', [-1, 1]),
+    (23, b'\x00\x80\x01\x00', [-32768, 1]),
+    (24, b'\xfe\xff\xff\xff', [-2]),
+    (25, b'\xff' * 8, [-1]),
+    (26, b'\xff\x01', [255, 1]),
+    (27, b'\x00\x80', [32768]),
+    (28, b'\xfe\xff\xff\xff', [4294967294]),
+    (29, b'\xff' * 8, [18446744073709551615]),
+    (30, b'\x00\x00\xc0\x3f', [1.5]),
+    (31, b'\x00\x00\x00\x00\x00\x00\x04\x40', [2.5]),
+    (32, b'\x0a\x00\x00\x00\xa5\x80', [True, False, True, False, False, True, False, True, True, False]),
+    (33, b'ab\x00\x00cd\x00', ["ab", "", "cd"]),
+    (34, b'\xd0\x99\x4e\xbd\x92\x01\x00\x00', [1729752898000]),
+    (17, b'\x01', None)
+])
+def test_unpack_array(datatype, data, expected):
+    assert mqtt_sparkplug.unpack_array(data, datatype) == expected
+
+
+def test_unpack_array_partial_element():
+    with pytest.raises(ValueError):
+        mqtt_sparkplug.unpack_array(b'\x01\x02\x03', 24)
+
+
+class TestTimestampFormatter:
+
+    def test_milliseconds(self):
+        timestamps = mqtt_sparkplug.TimestampFormatter()
+        assert timestamps.milliseconds(1729752898172) == "2024-10-24 06:54:58.172000+00:00"
+        assert timestamps.milliseconds(1729752898005) == "2024-10-24 06:54:58.005000+00:00"
+        assert timestamps.milliseconds(1729752899000) == "2024-10-24 06:54:59.000000+00:00"
+
+    def test_seconds(self):
+        timestamps = mqtt_sparkplug.TimestampFormatter()
+        assert timestamps.seconds(1729752898.172973) == "2024-10-24 06:54:58.172973+00:00"
+        assert timestamps.seconds(0) == "1970-01-01 00:00:00.000000+00:00"
+
+
+class TestDeadbandFilter:
+
+    @pytest.mark.parametrize("mode, deadband, values, expected", [
+        ('Unchanged', 0, [1, 1, 2, 2.0, "a", "a"], [1, 2, "a"]),
+        ('Absolute deadband', 0.5, [10, 10.4, 10.6, 11.0, 11.2, "a", "a"], [10, 10.6, 11.2, "a"]),
+        ('Percent deadband', 10, [100, 109, 111, 121, 0, 0], [100, 111, 0]),
+        ('Absolute deadband', 1, [True, True, False], [True, False])
+    ])
+    def test_report(self, mode, deadband, values, expected):
+        report_filter = mqtt_sparkplug.DeadbandFilter(mode, deadband, 0)
+        last_values = report_filter.last_values("Opto22/groovEPIC_workshop", None)
+        assert [value for value in values if report_filter.report(last_values, "m", value, 0)] == expected
+
+    def test_heartbeat(self):
+        report_filter = mqtt_sparkplug.DeadbandFilter('Unchanged', 0, 60)
+        last_values = report_filter.last_values("Opto22/groovEPIC_workshop", "Strategy")
+        assert [report_filter.report(last_values, "m", 1, now) for now in (0, 30, 59, 60, 61)] == [
+            True, False, False, True, False]
+
+    def test_forget(self):
+        report_filter = mqtt_sparkplug.DeadbandFilter('Unchanged', 0, 0)
+        assert report_filter.report(report_filter.last_values("g/n", "d"), "m", 1, 0)
+        assert not report_filter.report(report_filter.last_values("g/n", "d"), "m", 1, 0)
+        report_filter.forget("g/n", "d")
+        assert report_filter.report(report_filter.last_values("g/n", "d"), "m", 1, 0)
+        report_filter.forget("g/n")
+        assert report_filter.report(report_filter.last_values("g/n", "d"), "m", 1, 0)
+
+
+class TestAliasTable:
+
+    @staticmethod
+    def birth_metrics(pb2, aliases):
+        payload = pb2.Payload()
+        for alias in aliases:
+            metric = payload.metrics.add()
+            metric.name = "metric{}".format(alias)
+            metric.alias = alias
+            metric.datatype = 9
+        return payload.metrics
+
+    @pytest.mark.parametrize("aliases", [[0, 1, 2, 3], [5, 1000000, 42]])
+    def test_lookup(self, pb2, aliases):
+        table = mqtt_sparkplug.AliasTable(self.birth_metrics(pb2, aliases))
+        for alias in aliases:
+            assert table.name(alias) == "metric{}".format(alias)
+            assert table.datatype(alias) == 9
+        assert table.name(7) is None
+        assert table.datatype(7) == 0
+
+
+@pytest.mark.parametrize("value, bits, expected", [
+    (0xFF, 8, -1),
+    (0xFFFFFFFF, 8, -1),
+    (0x7F, 8, 127),
+    (0x8000, 16, -32768),
+    (0x80000000, 32, -2147483648),
+    (0xFFFFFFFFFFFFFFFE, 64, -2),
+    (5, 64, 5)
+])
+def test_to_signed(value, bits, expected):
+    assert mqtt_sparkplug.to_signed(value, bits) == expected
+
+
+@pytest.mark.parametrize("field, value, datatype, expected", [
+    ("int_value", 0xFFFFFFFB, 0, -5),
+    ("int_value", 0xFFFFFFFB, 7, 0xFFFFFFFB),
+    ("int_value", 0xFB, 1, -5),
+    ("long_value", 0xFFFFFFFFFFFFFFFB, 0, -5),
+    ("long_value", 0xFFFFFFFFFFFFFFFB, 8, 0xFFFFFFFFFFFFFFFB),
+    ("double_value", 1.5, 10, 1.5),
+    ("boolean_value", True, 11, True),
+    ("string_value", "on", 12, "on"),
+    ("bytes_value", b"on", 17, "b24="),
+    ("bytes_value", b"on", 20, None)
+])
+def test_metric_value(pb2, field, value, datatype, expected):
+    metric = pb2.Payload.Metric()
+    setattr(metric, field, value)
+    assert mqtt_sparkplug.metric_value(metric, datatype) == expected
+
+
+class TestSessions:
+    NODE = "spBv1.0/Opto22/{}/groovEPIC_workshop"
+    DEVICE = "spBv1.0/Opto22/{}/groovEPIC_workshop/Strategy"
+
+    @staticmethod
+    def certificate(pb2, sequence):
+        payload = pb2.Payload()
+        metric = payload.metrics.add()
+        metric.name = "bdSeq"
+        metric.datatype = 8
+        metric.long_value = sequence
+        return payload.SerializeToString()
+
+    def test_state_readings(self, pb2):
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(sessionAsset='session'))
+        readings = decoder.decode(self.NODE.format("NBIRTH"), self.certificate(pb2, 3), 0)
+        assert readings[0] == {'asset': 'session', 'timestamp': '1970-01-01 00:00:00.000000+00:00',
+                               'readings': {'node': 'Opto22/groovEPIC_workshop', 'state': 'online', 'bdSeq': 3}}
+        readings = decoder.decode(self.DEVICE.format("DBIRTH"), b'', 1)
+        assert readings[0]['readings'] == {'node': 'Opto22/groovEPIC_workshop', 'device': 'Strategy',
+                                           'state': 'online'}
+        # The Will message of an earlier connection does not end the session
+        readings = decoder.decode(self.NODE.format("NDEATH"), self.certificate(pb2, 2), 2)
+        assert [reading['asset'] for reading in readings] == ['mqtt']
+        assert decoder.sessions.online("Opto22/groovEPIC_workshop", "Strategy")
+        readings = decoder.decode(self.NODE.format("NDEATH"), self.certificate(pb2, 3), 3)
+        assert readings[0]['readings']['state'] == 'offline'
+        assert not decoder.sessions.online("Opto22/groovEPIC_workshop", "Strategy")
+        # The device went offline with its edge node
+        assert decoder.decode(self.DEVICE.format("DDEATH"), b'', 4) == []
+
+    def test_tracker(self):
+        tracker = mqtt_sparkplug.SessionTracker()
+        tracker.birth("g/n", None, 0, 0)
+        tracker.birth("g/n", "d", None, 1)
+        tracker.seen("g/n", "d", 2)
+        assert tracker.nodes["g/n"].devices["d"].last_seen == 2
+        # A rebirth makes the devices stale until their own rebirth
+        tracker.birth("g/n", None, 1, 3)
+        assert tracker.online("g/n") and not tracker.online("g/n", "d")
+        tracker.birth("g/n", "d", None, 4)
+        assert tracker.online("g/n", "d")
+        assert tracker.death("g/n", "d", None, 5) and not tracker.death("g/n", "d", None, 6)
+
+
+class TestSequence:
+
+    def test_sequence(self):
+        tracker = mqtt_sparkplug.SessionTracker()
+        assert tracker.sequence("g/n", 254, birth=True) == 0
+        assert [tracker.sequence("g/n", seq) for seq in (255, 0, 0, 3, 2, 4)] == [0, 0, 0, 2, 0, 0]
+        assert tracker.sequence_counts() == (2, 1, 1)
+
+    def test_rebirth_is_rate_limited(self, pb2):
+        publish = MagicMock()
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(rebirthRequests='true', rebirthInterval='60'),
+                                                  publish=publish)
+        for seq, now in [(0, 0), (5, 1), (9, 2), (20, 61)]:
+            payload = pb2.Payload(seq=seq)
+            decoder.decode("spBv1.0/Opto22/NDATA/groovEPIC_workshop", payload.SerializeToString(), now)
+        assert publish.call_count == 2
+        topic, command = publish.call_args[0]
+        assert topic == "spBv1.0/Opto22/NCMD/groovEPIC_workshop"
+        payload = pb2.Payload()
+        payload.ParseFromString(command)
+        assert payload.metrics[0].name == "Node Control/Rebirth" and payload.metrics[0].boolean_value
+
+
+class TestReorderBuffer:
+
+    def test_released_in_seq_order(self):
+        buffer = mqtt_sparkplug.ReorderBuffer(1.0, 8)
+        assert buffer.add("g/n", 254, "a", 0, restart=True) == ["a"]
+        assert buffer.add("g/n", 0, "c", 0) == []
+        assert buffer.add("g/n", 1, "d", 0) == []
+        assert buffer.wait_time(0.5) == 0.5
+        assert buffer.add("g/n", 255, "b", 0.5) == ["b", "c", "d"]
+        assert not buffer.waiting
+        # Late, the message is not held
+        assert buffer.add("g/n", 255, "b", 0.6) == ["b"]
+
+    def test_bounded_wait_and_depth(self):
+        buffer = mqtt_sparkplug.ReorderBuffer(1.0, 2)
+        buffer.add("g/n", 0, "a", 0, restart=True)
+        buffer.add("g/n", 2, "c", 0)
+        assert buffer.expire(0.5) == []
+        assert buffer.expire(1.0) == ["c"]
+        buffer.add("g/n", 5, "f", 2)
+        buffer.add("g/n", 7, "h", 2)
+        # A third message held gives up on the first gap only
+        assert buffer.add("g/n", 8, "i", 2) == ["f"]
+        assert buffer.add("g/n", 6, "g", 2) == ["g", "h", "i"]
+
+    def test_decoder_reorders(self, pb2):
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(reorderWindow='100'))
+        values = []
+        for seq in (0, 2, 1):
+            payload = pb2.Payload(seq=seq)
+            metric = payload.metrics.add()
+            metric.name = "Value"
+            metric.int_value = seq
+            readings = decoder.decode(DDATA_TOPIC, payload.SerializeToString(), 0)
+            values.extend(reading['readings']['Value'] for reading in readings)
+        assert values == [0, 1, 2]
+        assert decoder.sessions.sequence_counts() == (0, 0, 0)
+
+    def test_decoder_reuses_payload(self, pb2):
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(reorderWindow='100'))
+        assert decoder.payload is None
+        decoder.decode(DDATA_TOPIC, pb2.Payload(seq=0).SerializeToString(), 0)
+        reused = decoder.payload
+        if reused is None:
+            pytest.skip("The upb protobuf backend parses each message into a new Payload")
+        decoder.decode(DDATA_TOPIC, pb2.Payload(seq=1).SerializeToString(), 0)
+        assert decoder.payload is reused
+        # A message held for reordering keeps its payload
+        decoder.decode(DDATA_TOPIC, pb2.Payload(seq=3).SerializeToString(), 0)
+        assert decoder.payload is None and reused.seq == 3
+
+
+def test_decoder_configure_keeps_sessions(pb2):
+    birth = pb2.Payload()
+    metric = birth.metrics.add()
+    metric.name = "Temperature"
+    metric.alias = 1
+    metric.datatype = 10
+    data = pb2.Payload()
+    metric = data.metrics.add()
+    metric.alias = 1
+    metric.double_value = 2.5
+    decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config())
+    decoder.decode(DDATA_TOPIC.replace("DDATA", "DBIRTH"), birth.SerializeToString(), 0)
+    decoder.configure(plugin_config(assetName='other', datapoints='Per device'))
+    readings = decoder.decode(DDATA_TOPIC, data.SerializeToString(), 0)
+    assert readings[0]['asset'] == 'other' and readings[0]['readings'] == {"Temperature": 2.5}
+
+
+class TestBirthSnapshot:
+    NBIRTH_TOPIC = "spBv1.0/Opto22/NBIRTH/groovEPIC_workshop"
+
+    def test_restart_resolves_aliases(self, pb2, tmp_path):
+        path = str(tmp_path / "snapshot.birth")
+        birth = pb2.Payload()
+        metric = birth.metrics.add()
+        metric.name = "bdSeq"
+        metric.long_value = 7
+        metric = birth.metrics.add()
+        metric.name = "Temperature"
+        metric.alias = 4
+        metric.datatype = 10
+        metric.double_value = 20.0
+        snapshot = mqtt_sparkplug.BirthSnapshot(path)
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(), snapshot=snapshot)
+        decoder.decode(self.NBIRTH_TOPIC, birth.SerializeToString(), 0)
+        decoder.decode(DDATA_TOPIC.replace("DDATA", "DBIRTH"), birth.SerializeToString(), 0)
+        snapshot.save()
+
+        data = pb2.Payload()
+        metric = data.metrics.add()
+        metric.alias = 4
+        metric.double_value = 21.5
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(), snapshot=mqtt_sparkplug.BirthSnapshot(path))
+        readings = decoder.decode(DDATA_TOPIC, data.SerializeToString(), 0)
+        assert readings[0]['readings'] == {"Temperature": 21.5}
+        assert decoder.sessions.nodes["Opto22/groovEPIC_workshop"].bd_seq == 7
+
+    def test_certificate_drops_values(self, pb2):
+        birth = pb2.Payload()
+        metric = birth.metrics.add()
+        metric.name = "Temperature"
+        metric.datatype = 10
+        metric.double_value = 20.0
+        certificate = pb2.Payload()
+        certificate.ParseFromString(mqtt_sparkplug.birth_certificate(birth))
+        assert certificate.metrics[0].name == "Temperature" and not certificate.metrics[0].HasField("double_value")
+
+    def test_corrupt_file_is_ignored(self, tmp_path):
+        path = tmp_path / "snapshot.birth"
+        path.write_bytes(b"SPBS\x01\x05\x00")
+        assert mqtt_sparkplug.BirthSnapshot(str(path)).records == {}
+
+    def test_path_without_fledge_data(self):
+        with patch.object(mqtt_sparkplug, '_FLEDGE_DATA', None), \
+                patch.object(mqtt_sparkplug, '_FLEDGE_ROOT', '/usr/local/fledge'):
+            path = mqtt_sparkplug.snapshot_path(plugin_config())
+        assert path.startswith('/usr/local/fledge/data/mqtt_sparkplug/')
+
+    def test_path_is_per_service(self):
+        paths = set()
+        for name in ('MQTT 1', 'MQTT 2'):
+            with patch.object(mqtt_sparkplug.sys, 'argv', ['south', '--name=' + name]):
+                paths.add(mqtt_sparkplug.snapshot_path(plugin_config()))
+        assert len(paths) == 2 and all('/MQTT_' in path for path in paths)
+
+    def test_save_leaves_no_temporary_file(self, pb2, tmp_path):
+        snapshot = mqtt_sparkplug.BirthSnapshot(str(tmp_path / "snapshot.birth"))
+        snapshot.record("g/n", None, pb2.Payload())
+        snapshot.save()
+        assert [path.name for path in tmp_path.iterdir()] == ["snapshot.birth"]
+
+
+class TestMultiPart:
+
+    @staticmethod
+    def part(pb2, metric_payload, seq, data, size, md5=""):
+        metric = metric_payload.metrics.add()
+        metric.name = "Log"
+        metric.datatype = 18
+        metric.metadata.is_multi_part = True
+        metric.metadata.seq = seq
+        metric.metadata.size = size
+        metric.metadata.md5 = md5
+        metric.bytes_value = data
+
+    def test_parts_are_reassembled(self, pb2):
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config())
+        md5 = "5D41402ABC4B2A76B9719D911017C592"
+        for seq, data in [(1, b"llo"), (0, b"he")]:
+            payload = pb2.Payload()
+            self.part(pb2, payload, seq, data, 5, md5)
+            readings = decoder.decode(DDATA_TOPIC, payload.SerializeToString(), 0)
+        assert readings[0]['readings'] == {"Log": "aGVsbG8="}
+        assert len(decoder.multipart) == 0 and decoder.multipart.memory == 0
+
+    def test_md5_mismatch_is_discarded(self, pb2):
+        assembler = mqtt_sparkplug.MultiPartAssembler(60, 1024)
+        metadata = pb2.Payload.MetaData(is_multi_part=True, seq=0, size=2, md5="00")
+        assert assembler.add("k", metadata, b"he", 0) is None
+        assert assembler.memory == 0
+
+    def test_timeout_and_memory_limit(self, pb2):
+        assembler = mqtt_sparkplug.MultiPartAssembler(60, 4)
+        metadata = pb2.Payload.MetaData(is_multi_part=True, seq=0, size=10)
+        assembler.add("a", metadata, b"abc", 0)
+        assembler.add("b", metadata, b"ab", 1)
+        # Over the limit, the least recently updated transfer goes
+        assert list(assembler._transfers) == ["b"] and assembler.memory == 2
+        assembler.add("c", metadata, b"a", 61)
+        assert list(assembler._transfers) == ["c"] and assembler.memory == 1
+
+    def test_decoder_expires_stalled_transfer(self, pb2):
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(multipartTimeout='60'))
+        payload = pb2.Payload()
+        self.part(pb2, payload, 0, b"he", 5)
+        decoder.decode(DDATA_TOPIC, payload.SerializeToString(), 100)
+        assert len(decoder.multipart) == 1 and decoder.wait_time(130) == 30
+        assert decoder.expire(160) == []
+        assert len(decoder.multipart) == 0 and decoder.multipart.memory == 0 and decoder.wait_time(160) is None
+
+    def test_transfer_without_size_is_ignored(self, pb2):
+        assembler = mqtt_sparkplug.MultiPartAssembler(60, 1024)
+        metadata = pb2.Payload.MetaData(is_multi_part=True, seq=0)
+        assert assembler.add("k", metadata, b"he", 0) is None
+        assert len(assembler) == 0 and assembler.memory == 0
+
+
+class TestAssetNamer:
+
+    @pytest.mark.parametrize("topic, expected", [
+        (DDATA_TOPIC, "Opto22_groovEPIC_workshop/Strategy"),
+        ("spBv1.0/Opto22/NDATA/groovEPIC_workshop", "Opto22_groovEPIC_workshop")
+    ])
+    def test_topic_fragments(self, topic, expected):
+        namer = mqtt_sparkplug.AssetNamer('Topic Fragments', 'mqtt', '{group_id}_{edge_node_id}/{device_id}')
+        assert namer.asset(topic) == expected
+
+    def test_default_topic_fragments(self):
+        namer = mqtt_sparkplug.AssetNamer('Topic Fragments', 'mqtt', config['topicFragments']['default'].lower())
+        assert namer.asset(DDATA_TOPIC) == "spbv1.0/Opto22/DDATA/groovEPIC_workshop/Strategy"
+
+    def test_invalid_topic_fragments(self):
+        namer = mqtt_sparkplug.AssetNamer('Topic Fragments', 'mqtt', '{group_id}/{unknown}')
+        with pytest.raises(KeyError):
+            namer.asset(DDATA_TOPIC)
+
+    def test_topic_and_asset_name(self):
+        assert mqtt_sparkplug.AssetNamer('Topic', 'mqtt', '').asset(DDATA_TOPIC) == DDATA_TOPIC
+        assert mqtt_sparkplug.AssetNamer('Asset Name', 'mqtt', '').asset(DDATA_TOPIC) == 'mqtt'
+        assert mqtt_sparkplug.AssetNamer('Asset Name', '', '').asset(DDATA_TOPIC) == DDATA_TOPIC
+
+    def test_cache_is_bounded(self):
+        namer = mqtt_sparkplug.AssetNamer('Topic', 'mqtt', '', cache_size=2)
+        for device in range(5):
+            namer.asset("{}/{}".format(DDATA_TOPIC, device))
+        assert list(namer._cache) == ["{}/3".format(DDATA_TOPIC), "{}/4".format(DDATA_TOPIC)]
+
+
+@pytest.mark.parametrize("topic, expected", [
+    (DDATA_TOPIC, True),
+    ("spBv1.0/Opto22/NDATA/groovEPIC_workshop", True),
+    ("spBv1.0/Opto22/+/groovEPIC_workshop/+", True),
+    ("spBv1.0/+/DDATA/#", True),
+    ("spBv1.0/#", True),
+    ("spBv1.0/Opto22/DDATA", False),
+    ("spBv1.0/Opto22/DDATA/groovEPIC_workshop/Strategy/extra", False),
+    ("spAv1.0/Opto22/DDATA/groovEPIC_workshop", False),
+    ("spBv1.0/Opto22/message_type/groovEPIC_workshop", False),
+    ("spBv1.0/Opto22//groovEPIC_workshop", False),
+    ("spBv1.0/Opto22/DDATA/groovEPIC+/Strategy", False),
+    ("spBv1.0/#/DDATA/groovEPIC_workshop", False),
+    ("#", False)
+])
+def test_validate_topic(topic, expected):
+    with patch.object(mqtt_sparkplug.mqtt, 'Client'):
+        client = mqtt_sparkplug.MqttSubscriberClient(plugin_config())
+    assert client.validate_topic(topic) is expected
+
+
+class TestTopicFilterIndex:
+
+    def test_match(self):
+        index = mqtt_sparkplug.TopicFilterIndex()
+        index.add("spBv1.0/Opto22/DDATA/groovEPIC_workshop/Strategy", "exact")
+        index.add("spBv1.0/Opto22/+/groovEPIC_workshop/+", "single")
+        index.add("spBv1.0/#", "multi")
+        assert index.match(DDATA_TOPIC) == "exact"
+        assert index.match("spBv1.0/Opto22/DBIRTH/groovEPIC_workshop/Other") == "single"
+        assert index.match("spBv1.0/Opto22/NBIRTH/groovEPIC_workshop") == "multi"
+        assert index.match("spBv1.0") == "multi"
+        assert index.match("other/Opto22/NBIRTH/groovEPIC_workshop") is None
+
+    def test_first_added_filter_wins(self):
+        index = mqtt_sparkplug.TopicFilterIndex()
+        index.add("spBv1.0/#", "multi")
+        index.add(DDATA_TOPIC, "exact")
+        assert index.match(DDATA_TOPIC) == "multi"
+
+
+class TestSubscriptions:
+
+    def test_per_subscription_settings(self, pb2):
+        payload = pb2.Payload()
+        metric = payload.metrics.add()
+        metric.name = "Temperature"
+        metric.double_value = 21.5
+        subscriptions = {"subscriptions": [{"topic": "spBv1.0/Other/+/#", "assetNaming": "Topic"}]}
+        decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(
+            topic=DDATA_TOPIC, datapoints='Per device', subscriptions=json.dumps(subscriptions)))
+        topic = "spBv1.0/Other/NDATA/node"
+        assert decoder.decode(DDATA_TOPIC, payload.SerializeToString(), 0)[0]['asset'] == 'mqtt'
+        assert decoder.decode(topic, payload.SerializeToString(), 0)[0]['asset'] == topic
+
+    def test_invalid_subscriptions_are_ignored(self):
+        settings = mqtt_sparkplug.subscription_settings(plugin_config(subscriptions='{"subscriptions": [{}, 1]}'))
+        assert [entry['topic'] for entry in settings] == [config['topic']['default']]
+
+    @pytest.mark.parametrize("override", [{"datapoints": "Per Device"}, {"assetName": 5}, {"assetNaming": None}])
+    def test_invalid_overrides_are_ignored(self, pb2, override):
+        topic = "spBv1.0/Other/NDATA/node"
+        subscriptions = {"subscriptions": [dict(override, topic=topic)]}
+        category = plugin_config(topic=DDATA_TOPIC, subscriptions=json.dumps(subscriptions))
+        settings = mqtt_sparkplug.subscription_settings(category)
+        assert settings[1] == dict(settings[0], topic=topic)
+        payload = pb2.Payload()
+        payload.metrics.add(name="Temperature", double_value=1.0)
+        readings = mqtt_sparkplug.SparkplugDecoder(category).decode(topic, payload.SerializeToString(), 0)
+        assert [reading['readings'] for reading in readings] == [{'Temperature': 1.0}]
+
+
+@pytest.mark.parametrize("group, expected", [
+    ("", [(DDATA_TOPIC, 0)]),
+    ("fledge", [("$share/fledge/" + DDATA_TOPIC, 0)])
+])
+def test_on_connect_subscribes(group, expected):
+    with patch.object(mqtt_sparkplug.mqtt, 'Client'):
+        client = mqtt_sparkplug.MqttSubscriberClient(plugin_config(topic=DDATA_TOPIC,
+                                                                   sharedSubscriptionGroup=group))
+    mqtt_client = MagicMock()
+    client.on_connect(mqtt_client, None, {}, 0)
+    mqtt_client.subscribe.assert_called_once_with(expected)
+
+
+@pytest.mark.parametrize("topic, expected", [
+    ("spBv1.0/Opto22/NBIRTH/node", ["spBv1.0/Opto22/NBIRTH/node"]),
+    ("spBv1.0/Opto22/+/node/#", ["spBv1.0/Opto22/NBIRTH/node/#", "spBv1.0/Opto22/NDEATH/node/#",
+                                 "spBv1.0/Opto22/DBIRTH/node/#", "spBv1.0/Opto22/DDEATH/node/#",
+                                 "$share/g/spBv1.0/Opto22/NDATA/node/#", "$share/g/spBv1.0/Opto22/DDATA/node/#",
+                                 "$share/g/spBv1.0/Opto22/NCMD/node/#", "$share/g/spBv1.0/Opto22/DCMD/node/#",
+                                 "$share/g/spBv1.0/Opto22/STATE/node/#"]),
+    ("spBv1.0/#", ["spBv1.0/+/NBIRTH/#", "spBv1.0/+/NDEATH/#", "spBv1.0/+/DBIRTH/#", "spBv1.0/+/DDEATH/#",
+                   "$share/g/spBv1.0/+/NDATA/#", "$share/g/spBv1.0/+/DDATA/#", "$share/g/spBv1.0/+/NCMD/#",
+                   "$share/g/spBv1.0/+/DCMD/#", "$share/g/spBv1.0/+/STATE/#"])
+])
+def test_shared_subscription_filters(topic, expected):
+    assert mqtt_sparkplug.shared_subscription_filters([topic], "g") == expected
+
+
+def test_shared_subscription_certificates_only_update_state(pb2):
+    decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(sharedSubscriptionGroup='g', sessionAsset='sessions'))
+    birth = pb2.Payload()
+    birth.metrics.add(name="Temperature", alias=0, datatype=10, double_value=20.0)
+    assert decoder.decode("spBv1.0/Opto22/NBIRTH/groovEPIC_workshop", birth.SerializeToString(), 0) == []
+    data = pb2.Payload()
+    data.metrics.add(alias=0, double_value=21.5)
+    readings = decoder.decode("spBv1.0/Opto22/NDATA/groovEPIC_workshop", data.SerializeToString(), 0)
+    assert [reading['readings'] for reading in readings] == [{'Temperature': 21.5}]
+    assert decoder.decode("spBv1.0/Opto22/NDEATH/groovEPIC_workshop", pb2.Payload().SerializeToString(), 0) == []
+
+
+def test_shared_subscription_disables_multipart_and_report_by_exception(pb2):
+    decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(sharedSubscriptionGroup='g',
+                                                            reportByException='Unchanged'))
+    assert decoder.report_filter is None
+    payload = pb2.Payload()
+    metric = payload.metrics.add(name="Log", datatype=18, bytes_value=b"he")
+    metric.metadata.is_multi_part = True
+    metric.metadata.size = 5
+    payload.metrics.add(name="Value", int_value=1)
+    for _ in range(2):
+        readings = decoder.decode(DDATA_TOPIC, payload.SerializeToString(), 0)
+        assert [reading['readings'] for reading in readings] == [{'Value': 1}]
+    assert len(decoder.multipart) == 0
+
+
+def test_shared_subscription_skips_sequence(pb2):
+    decoder = mqtt_sparkplug.SparkplugDecoder(plugin_config(sharedSubscriptionGroup='g', reorderWindow='100'))
+    assert decoder.reorder is None
+    for seq in (0, 5, 9):
+        payload = pb2.Payload(seq=seq)
+        payload.metrics.add(name='Temperature', datatype=10, double_value=1.0)
+        assert decoder.decode(DDATA_TOPIC, payload.SerializeToString(), 0)
+    assert decoder.sessions.sequence_counts() == (0, 0, 0)
+
+
+def test_reconnect_backoff():
+    backoff = mqtt_sparkplug.ReconnectBackoff(1, 10, 0)
+    assert [backoff.next_delay() for _ in range(6)] == [1, 2, 4, 8, 10, 10]
+    backoff.reset()
+    assert backoff.next_delay() == 1
+    assert 4 <= mqtt_sparkplug.ReconnectBackoff(8, 10, 0.5).next_delay() <= 8
+
+
+def test_connect_failures_are_counted():
+    with patch.object(mqtt_sparkplug.mqtt, 'Client'):
+        client = mqtt_sparkplug.MqttSubscriberClient(plugin_config(reconnectMinDelay='3', reconnectJitter='0'))
+    mqtt_client = MagicMock()
+    client.on_connect_fail(mqtt_client, None)
+    client.on_connect_fail(mqtt_client, None)
+    mqtt_client.reconnect_delay_set.assert_called_with(6, 6)
+    client.on_connect(mqtt_client, None, {}, 5)
+    values = client.statistics.values(client)
+    assert values['connectionFailures'] == 3
+    assert values['protobufBackend'] == mqtt_sparkplug.api_implementation.Type()
+    client.on_connect(mqtt_client, None, {}, 0)
+    assert client.statistics.connected and client.backoff.failures == 0
+
+
+@pytest.mark.parametrize("shared_memory", ['0', '1'])
+def test_decode_processes(pb2, shared_memory):
+    with patch.object(mqtt_sparkplug.mqtt, 'Client'):
+        client = mqtt_sparkplug.MqttSubscriberClient(plugin_config(decodeProcesses='2', birthSnapshot='false',
+                                                                   sharedMemorySize=shared_memory,
+                                                                   datapoints='Per device',
+                                                                   attachTopicDatapoint='true'))
+    readings = []
+    client.batcher = mqtt_sparkplug.ReadingsBatcher(readings.extend, 1000, 60)
+    client.start()
+    for node in range(4):
+        for value in range(3):
+            payload = pb2.Payload()
+            metric = payload.metrics.add()
+            metric.name = "Value"
+            metric.int_value = value
+            message = MagicMock(topic="spBv1.0/Opto22/DDATA/node{}/Strategy".format(node),
+                                payload=payload.SerializeToString())
+            client.on_message(None, None, message)
+    client.stop()
+    assert all(not process.process.is_alive() for process in client.processes)
+    assert len(readings) == 12
+    for node in range(4):
+        topic = "spBv1.0/Opto22/DDATA/node{}/Strategy".format(node)
+        # The order of the messages of an edge node is kept
+        assert [reading['readings']['Value'] for reading in readings
+                if reading['readings']['SparkPlugB:Topic'] == topic] == [0, 1, 2]
+
+
+@pytest.mark.parametrize("shared_memory", ['0', '1'])
+def test_exited_decode_process_drops_messages(pb2, shared_memory):
+    with patch.object(mqtt_sparkplug.mqtt, 'Client'):
+        client = mqtt_sparkplug.MqttSubscriberClient(plugin_config(decodeProcesses='1', birthSnapshot='false',
+                                                                   sharedMemorySize=shared_memory, queueSize='2'))
+    client.batcher = mqtt_sparkplug.ReadingsBatcher(lambda readings: None, 1000, 60)
+    client.start()
+    process = client.processes[0].process
+    process.terminate()
+    process.join()
+    message = MagicMock(topic=DDATA_TOPIC, payload=b"x" * 1024)
+    deadline = time.monotonic() + 10
+    # Under the Block policy, nothing holds the network thread once the failure has been seen
+    while client.statistics.values(client)['dropped'] < 10 and time.monotonic() < deadline:
+        client.on_message(None, None, message)
+    assert client.statistics.values(client)['dropped'] >= 10
+    client.stop()
+
+
+def test_shared_ring_wraps_around():
+    ring = mqtt_sparkplug.SharedRing(128, 'Drop newest')
+    received = []
+
+    def handler(topic, payload, receive_time):
+        received.append((topic, bytes(payload), receive_time))
+
+    for i in range(10):
+        assert ring.put("a/b", bytes([i]) * 40, i)
+        assert ring.read(handler) == 1
+    assert received[-1] == ("a/b", bytes([9]) * 40, 9)
+    # Full: the second message does not fit
+    assert ring.put("a/b", b"x" * 48, 10) and not ring.put("a/b", b"y" * 48, 11)
+    assert ring.overflows == 1
+    ring.read(handler)
+    assert received[-1][1] == b"x" * 48
+
+
+def test_shared_ring_blocks_until_read():
+    ring = mqtt_sparkplug.SharedRing(128)
+    received = []
+
+    def handler(topic, payload, receive_time):
+        received.append(bytes(payload))
+
+    assert ring.put("a/b", b"x" * 48, 0)
+    reader = threading.Timer(0.05, ring.read, args=(handler,))
+    reader.start()
+    # Waits for the reader to free the space of the first message
+    assert ring.put("a/b", b"y" * 48, 1)
+    reader.join()
+    ring.read(handler)
+    assert received == [b"x" * 48, b"y" * 48] and ring.overflows == 0
+    # Once closed, a message that does not fit is dropped rather than waited for
+    ring.close()
+    assert [ring.put("a/b", b"z" * 48, 2) for _ in range(3)] == [True, True, False]
+    assert ring.overflows == 1
+
+
+def test_asyncio_pipeline(pb2):
+    with patch.object(mqtt_sparkplug.mqtt, 'Client'):
+        client = mqtt_sparkplug.MqttSubscriberClient(plugin_config(pipeline='Asyncio', birthSnapshot='false',
+                                                                   batchSize='4', queueSize='2'))
+    client.loop = asyncio.new_event_loop()
+    batches = []
+    with patch.object(mqtt_sparkplug, 'ingest_readings', batches.append):
+        client.start()
+        while client.pipeline.received is None:
+            time.sleep(0.01)
+        for value in range(10):
+            payload = pb2.Payload()
+            metric = payload.metrics.add()
+            metric.name = "Value"
+            metric.int_value = value
+            message = MagicMock(topic=DDATA_TOPIC, payload=payload.SerializeToString())
+            client.loop.call_soon_threadsafe(client.pipeline.on_message, None, None, message)
+        client.stop()
+    client.loop.close()
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert [reading['readings']['Value'] for batch in batches for reading in batch] == list(range(10))